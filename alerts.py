@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Tuple
+from telegram.ext import ExtBot
+
+from helpers import MESSAGE_LENGTH_LIMIT, utf16_length
+from logger import logger
+
+# Distinct alerts kept per digest, further ones are only counted
+MAX_PENDING_ALERTS = 20
+
+class AdminAlertHandler(logging.Handler):
+    """Log handler that forwards error logs to the admin as periodic digests.
+
+    `emit` only buffers the record, so it's safe to call from any thread. Records logged
+    from the same place are deduplicated into one line with a count, and a bounded number
+    of distinct alerts is kept. `run` sends whatever was buffered as a single message every
+    `interval` seconds, which caps alerts at one message per interval during an error storm.
+    """
+
+    def __init__(self, admin_user_id: int, bot: ExtBot, interval: float = 30):
+        super().__init__()
+        self.admin_user_id = admin_user_id
+        self.bot = bot
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self._dropped = 0
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        # Logs from the same line are the same alert, whatever their arguments
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            if key in self._pending:
+                first_entry, count = self._pending[key]
+                self._pending[key] = (first_entry, count + 1)
+            elif len(self._pending) < MAX_PENDING_ALERTS:
+                self._pending[key] = (log_entry, 1)
+            else:
+                self._dropped += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush_alerts()
+
+    async def flush_alerts(self):
+        with self._lock:
+            pending, dropped = self._pending, self._dropped
+            self._pending, self._dropped = {}, 0
+
+        if not pending:
+            return
+
+        lines = [
+            f"[x{count}] {entry}" if count > 1 else entry
+            for entry, count in pending.values()
+        ]
+        if dropped:
+            lines.append(f"... and {dropped} more")
+
+        digest = "\n\n".join(lines)
+        if utf16_length(digest) > MESSAGE_LENGTH_LIMIT:
+            # Cut in UTF-16 code units as Telegram counts them, dropping a split surrogate pair
+            encoded = digest.encode('utf-16-le')[:(MESSAGE_LENGTH_LIMIT - 1) * 2]
+            digest = encoded.decode('utf-16-le', errors='ignore') + "…"
+
+        try:
+            await self.bot.send_message(text=digest, chat_id=self.admin_user_id)
+        except Exception as e:
+            # Not an error, which would feed back into the next digest
+            logger.warning('admin_alert_failed - alerts: %d - error: %s', len(pending), e)
@@ -0,0 +1,432 @@
+"""Offline end-to-end load test of a bot, without Telegram or paid APIs.
+
+Synthetic updates (text messages across many chats, mentions, photos and edits) are fed
+to a real `TelegramBot` through its `Application`, exactly like polled or webhook updates.
+The LLM, vision and embedding providers are stubs that sleep for a configurable
+log-normal latency, and the Telegram Bot API is faked at the HTTP layer, so everything
+between receiving an update and sending the reply runs as in production: access checks,
+SQLite, LanceDB, reply stages, Markdown conversion and sending.
+
+Reports reply latency (from enqueuing a mention to sending its reply), updates/sec, the
+time spent per stage and how much the SQLite database and LanceDB grew.
+
+Latencies are given as `median` or `median:sigma` in seconds, e.g. `--llm-latency 0.8:0.5`.
+
+Usage:
+    python3 benchmarks/load_test.py --updates 2000 --chats 50 --mention-ratio 0.2 --llm-latency 0.5:0.4
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+import json
+import math
+import numpy as np
+import os
+from pathlib import Path
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Keep the console quiet, all logs still go to the log file
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+
+from telegram import Update
+from telegram.constants import ReactionEmoji
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest, RequestData
+
+from bot import TelegramBot
+from database import Database, Message, User
+from dispatcher import PerChatUpdateProcessor
+from llm.client import Response, SummaryResponse, Usage
+from logger import configure_logger
+import metrics
+from rag import LANCEDB_ENGINE, MATRIX_ENGINE, Rag
+
+BOT_ID = 1_000_000
+BOT_NAME = "Benchy"
+BOT_USERNAME = "benchy_bot"
+ADMIN_USER_ID = 1
+
+# Replies get ids far above the synthetic messages of a chat
+REPLY_ID_OFFSET = 10_000_000
+
+STAGE_PATTERN = re.compile(r'telegram_bot_stage_seconds_(sum|count)\{bot="[^"]*",stage="(\w+)"\} (\S+)')
+
+class Latency(NamedTuple):
+    median: float
+    sigma: float
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+def _parse_latency(value: str) -> Latency:
+    median, _, sigma = value.partition(":")
+    return Latency(median=float(median), sigma=float(sigma or 0))
+
+# -----------------------------------------
+# Stub providers
+# -----------------------------------------
+
+class StubLLMClient:
+    def __init__(self, latency: Latency, reply_length: int, rng: random.Random):
+        self.latency = latency
+        self.reply_length = reply_length
+        self.rng = rng
+
+    def generate_response(self, prompt: str, messages: List[Message]) -> Response:
+        time.sleep(self.latency.sample(self.rng))
+        paragraph = "Sure, **that** works for me. Let's meet at *7pm* (see [map](https://example.com/a_b)).\n\n"
+        response = Response(
+            message=(paragraph * (self.reply_length // len(paragraph) + 1))[:self.reply_length],
+            reaction=ReactionEmoji.THUMBS_UP,
+            reaction_strength=self.rng.random()
+        )
+        response.usage = Usage(
+            input_tokens=len(prompt) // 4 + sum(len(message.text) for message in messages) // 4,
+            output_tokens=self.reply_length // 4
+        )
+        return response
+
+    def summarize(self, prompt: str, messages: List[Message]) -> SummaryResponse:
+        time.sleep(self.latency.sample(self.rng))
+        text = f"Summary of {len(messages)} messages."
+        return SummaryResponse(
+            text=text,
+            usage=Usage(
+                input_tokens=len(prompt) // 4 + sum(len(message.text) for message in messages) // 4,
+                output_tokens=len(text) // 4
+            )
+        )
+
+class StubVisionClient:
+    def __init__(self, latency: Latency, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+
+    def analyze(self, base64_image, prompt: str) -> str:
+        time.sleep(self.latency.sample(self.rng))
+        return "A group of friends at a table in a restaurant."
+
+class StubEmbeddingClient:
+    def __init__(self, dimensions: int, latency: Latency, rng: random.Random):
+        self.model = "stub"
+        self.dimensions = dimensions
+        self.latency = latency
+        self.rng = rng
+
+    def embed(self, text: str) -> List[float]:
+        time.sleep(self.latency.sample(self.rng))
+        return self._vector(text).tolist()
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        time.sleep(self.latency.sample(self.rng))
+        return np.stack([self._vector(text) for text in texts])
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.random.default_rng(abs(hash(text))).standard_normal(self.dimensions).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+# -----------------------------------------
+# Fake Telegram Bot API
+# -----------------------------------------
+
+class FakeBotApiRequest(BaseRequest):
+    """Answers Bot API calls locally, after a configurable latency, and records replies."""
+
+    def __init__(self, latency: Latency, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+        self.calls: Dict[str, int] = {}
+        self.reply_times: Dict[Tuple[int, int], float] = {}
+        self._next_reply_id = REPLY_ID_OFFSET
+        self._lock = threading.Lock()
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None, **kwargs) -> Tuple[int, bytes]:
+        await asyncio.sleep(self.latency.sample(self.rng))
+
+        # Photo downloads
+        if "/file/bot" in url:
+            return 200, b"\xff\xd8\xff\xe0" + bytes(20_000)
+
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        parameters: Dict[str, Any] = request_data.parameters if request_data else {}
+
+        if endpoint == "getMe":
+            return self._ok({"id": BOT_ID, "is_bot": True, "first_name": BOT_NAME, "username": BOT_USERNAME})
+        if endpoint == "getFile":
+            file_id = parameters["file_id"]
+            return self._ok({"file_id": file_id, "file_unique_id": file_id, "file_size": 20_004, "file_path": f"photos/{file_id}.jpg"})
+        if endpoint == "sendMessage":
+            return self._ok(self._sent_message(parameters=parameters))
+        return self._ok(True)
+
+    def _sent_message(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(parameters["chat_id"])
+        reply_parameters = parameters.get("reply_parameters")
+        if reply_parameters:
+            self.reply_times.setdefault((chat_id, reply_parameters["message_id"]), time.perf_counter())
+
+        with self._lock:
+            self._next_reply_id += 1
+            message_id = self._next_reply_id
+
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group", "title": "Load test"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": BOT_NAME, "username": BOT_USERNAME},
+            "text": parameters.get("text", ""),
+        }
+
+    def _ok(self, result: Any) -> Tuple[int, bytes]:
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+# -----------------------------------------
+# Synthetic updates
+# -----------------------------------------
+
+def _build_updates(
+    count: int,
+    chats: int,
+    users_per_chat: int,
+    mention_ratio: float,
+    photo_ratio: float,
+    edit_ratio: float,
+    rng: random.Random
+) -> Tuple[List[Dict[str, Any]], set[Tuple[int, int]]]:
+    updates: List[Dict[str, Any]] = []
+    expected_replies: set[Tuple[int, int]] = set()
+    next_message_ids = [0] * chats
+    sent: List[Dict[str, Any]] = []
+
+    for update_id in range(count):
+        chat_index = rng.randrange(chats)
+        chat = {"id": -1_000_000 - chat_index, "type": "group", "title": f"Chat {chat_index}"}
+        user_id = 100 + chat_index * users_per_chat + rng.randrange(users_per_chat)
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        mentioned = rng.random() < mention_ratio
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+        if mentioned:
+            text = f"{BOT_NAME}, {text}?"
+
+        roll = rng.random()
+        if sent and roll < edit_ratio:
+            original = rng.choice(sent)
+            updates.append({
+                "update_id": update_id,
+                "edited_message": {**original, "text": original["text"] + " (edited)", "edit_date": int(time.time())},
+            })
+            continue
+
+        next_message_ids[chat_index] += 1
+        message: Dict[str, Any] = {
+            "message_id": next_message_ids[chat_index],
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+        }
+        if roll < edit_ratio + photo_ratio:
+            file_id = f"photo{update_id}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]
+            message["caption"] = text
+        else:
+            message["text"] = text
+            sent.append(message)
+
+        if mentioned:
+            expected_replies.add((chat["id"], message["message_id"]))
+        updates.append({"update_id": update_id, "message": message})
+
+    return updates, expected_replies
+
+WORDS = (
+    "the a dinner friday tomorrow meet plans pizza movie weekend trip beach game score idea "
+    "maybe sure why how when where who budget tickets train late early coffee work project"
+).split()
+
+# -----------------------------------------
+# Load test
+# -----------------------------------------
+
+async def load_test(args: argparse.Namespace, path: Path):
+    rng = random.Random(args.seed)
+    configure_logger(path=path / "app.log")
+
+    fake_api = FakeBotApiRequest(latency=args.telegram_latency, rng=rng)
+    telegram = (
+        ApplicationBuilder()
+        .token("123456:LOAD-TEST")
+        .request(fake_api)
+        .get_updates_request(fake_api)
+        .updater(None)
+        .concurrent_updates(PerChatUpdateProcessor())
+        .build()
+    )
+
+    database = Database(path=path, admin_user_id=ADMIN_USER_ID, bot_id=BOT_ID, bot_name=BOT_NAME, bot_username=BOT_USERNAME)
+    rag = Rag(
+        path=path,
+        embedding_client=StubEmbeddingClient(dimensions=args.dimensions, latency=args.embedding_latency, rng=rng),
+        limit=5,
+        database=database,
+        engine=args.engine
+    )
+
+    # Every synthetic user is approved up front
+    with database.Session.begin() as session:
+        for user_id in range(100, 100 + args.chats * args.users_per_chat):
+            session.merge(User(id=user_id, first_name=f"User{user_id}"))
+
+    updates, expected_replies = _build_updates(
+        count=args.updates,
+        chats=args.chats,
+        users_per_chat=args.users_per_chat,
+        mention_ratio=args.mention_ratio,
+        photo_ratio=args.photo_ratio,
+        edit_ratio=args.edit_ratio,
+        rng=rng
+    )
+    database_size, vector_size = _database_size(path), _vector_size(path)
+
+    async with telegram:
+        bot = TelegramBot(
+            id=BOT_ID,
+            name=BOT_NAME,
+            username=BOT_USERNAME,
+            admin_user_id=ADMIN_USER_ID,
+            context_window=timedelta(hours=12),
+            reaction_threshold=0.8,
+            identity="You are a load test.",
+            path=path,
+            telegram=telegram,
+            database=database,
+            llm=StubLLMClient(latency=args.llm_latency, reply_length=args.reply_length, rng=rng),
+            vision=StubVisionClient(latency=args.vision_latency, rng=rng),
+            rag=rag
+        )
+        await bot.start()
+        await telegram.start()
+
+        enqueued_at: Dict[Tuple[int, int], float] = {}
+        started_at = time.perf_counter()
+        for index, update_json in enumerate(updates):
+            message = update_json.get("message")
+            if message:
+                enqueued_at[(message["chat"]["id"], message["message_id"])] = time.perf_counter()
+            await telegram.update_queue.put(Update.de_json(update_json, telegram.bot))
+
+            # Paced to the requested rate, otherwise as fast as the queue takes them
+            if args.rate:
+                delay = started_at + (index + 1) / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline and (
+            len(fake_api.reply_times) < len(expected_replies)
+            or telegram.update_queue.qsize() > 0
+            or telegram.update_processor.current_concurrent_updates > 0
+        ):
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started_at
+
+        # Stopping the bot applies the edits still queued for re-embedding
+        await telegram.stop()
+        await bot.stop()
+
+    latencies = [
+        reply_time - enqueued_at[key]
+        for key, reply_time in fake_api.reply_times.items()
+        if key in enqueued_at
+    ]
+    _report(
+        args=args,
+        updates=len(updates),
+        elapsed=elapsed,
+        latencies=latencies,
+        expected_replies=len(expected_replies),
+        database_growth=_database_size(path) - database_size,
+        vector_growth=_vector_size(path) - vector_size,
+        api_calls=fake_api.calls
+    )
+
+def _report(
+    args: argparse.Namespace,
+    updates: int,
+    elapsed: float,
+    latencies: List[float],
+    expected_replies: int,
+    database_growth: int,
+    vector_growth: int,
+    api_calls: Dict[str, int]
+):
+    print(f"updates: {updates} - chats: {args.chats} - engine: {args.engine} - elapsed: {elapsed:.2f}s")
+    print(f"throughput: {updates / elapsed:.1f} updates/sec")
+    print(f"replies: {len(latencies)}/{expected_replies}")
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(
+            f"reply latency - p50: {percentiles[49] * 1000:.0f}ms - p90: {percentiles[89] * 1000:.0f}ms - "
+            f"p99: {percentiles[98] * 1000:.0f}ms - max: {max(latencies) * 1000:.0f}ms"
+        )
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for kind, stage, value in STAGE_PATTERN.findall(metrics.render()):
+        stages.setdefault(stage, {})[kind] = float(value)
+    for stage, values in sorted(stages.items()):
+        print(f"stage {stage:<18} count: {values['count']:>7.0f} - mean: {values['sum'] / values['count'] * 1000:>8.2f}ms")
+
+    print(f"sqlite growth: {database_growth / 1024:.0f} KiB ({database_growth / updates:.0f} B/update)")
+    print(f"lancedb growth: {vector_growth / 1024:.0f} KiB ({vector_growth / updates:.0f} B/update)")
+    print("bot api calls: " + ", ".join(f"{endpoint}: {count}" for endpoint, count in sorted(api_calls.items())))
+
+def _database_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.glob("bot.db*"))
+
+def _vector_size(path: Path) -> int:
+    folders = [folder for folder in path.iterdir() if folder.is_dir() and folder.name != "images"]
+    return sum(file.stat().st_size for folder in folders for file in folder.rglob("*") if file.is_file())
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Offline end-to-end load test of a bot with stub providers.")
+    arg_parser.add_argument("--updates", type=int, default=2000, help="Number of synthetic updates")
+    arg_parser.add_argument("--chats", type=int, default=50, help="Number of distinct chats")
+    arg_parser.add_argument("--users-per-chat", type=int, default=5, help="Distinct users per chat")
+    arg_parser.add_argument("--mention-ratio", type=float, default=0.2, help="Share of messages mentioning the bot")
+    arg_parser.add_argument("--photo-ratio", type=float, default=0.05, help="Share of updates that are photos")
+    arg_parser.add_argument("--edit-ratio", type=float, default=0.05, help="Share of updates that are edits")
+    arg_parser.add_argument("--rate", type=float, default=0, help="Updates per second, 0 enqueues as fast as possible")
+    arg_parser.add_argument("--llm-latency", type=_parse_latency, default=Latency(0.5, 0.4), help="LLM latency")
+    arg_parser.add_argument("--vision-latency", type=_parse_latency, default=Latency(1.0, 0.3), help="Vision latency")
+    arg_parser.add_argument("--embedding-latency", type=_parse_latency, default=Latency(0.05, 0.3), help="Embedding latency")
+    arg_parser.add_argument("--telegram-latency", type=_parse_latency, default=Latency(0.03, 0.3), help="Bot API latency")
+    arg_parser.add_argument("--reply-length", type=int, default=600, help="Characters per LLM reply")
+    arg_parser.add_argument("--dimensions", type=int, default=256, help="Embedding dimensions")
+    arg_parser.add_argument("--engine", choices=[LANCEDB_ENGINE, MATRIX_ENGINE], default=LANCEDB_ENGINE, help="RAG engine")
+    arg_parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for all replies")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic updates and latencies")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(load_test(args=args, path=Path(directory)))
@@ -0,0 +1,167 @@
+"""Fuzz and benchmark the Markdown to Telegram MarkdownV2 converter.
+
+The fuzzer feeds random mixes of Markdown markers, code, links and text into
+`to_markdown_v2` and checks every result against the MarkdownV2 rules Telegram's parser
+enforces (reserved characters escaped outside of entities, entities closed and properly
+nested), so a reply can't fail to send because of its formatting. The benchmark then
+converts LLM-like replies of growing size to show conversion time stays linear.
+
+Usage:
+    python3 benchmarks/markdown_v2.py --cases 100000 --sizes 1000 10000 100000 1000000
+"""
+import argparse
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers import to_markdown_v2
+
+SPECIAL_CHARACTERS = set('_*[]()~`>#+-=|{}.!\\')
+
+FRAGMENTS = [
+    '*', '**', '***', '_', '__', '~', '~~', '`', '```', '```python\n', '#', '## ', '> ', '- ', '* ', '+ ',
+    '[', ']', '(', ')', '](', '[link](https://example.com/a_(b))', '|', '||', '\\', '.', '!', '=', '{', '}',
+    ' ', ' ', ' ', '\n', '\n', 'word', 'snake_case', '3.14', 'Hello', 'émoji 🔥', 'e.g.', '2*3',
+]
+
+LLM_REPLY = """## Summary
+
+Here's what **everyone** agreed on (mostly):
+
+- Meet at *7pm* on Friday, see [the map](https://maps.example.com/place?id=1_2)
+- Bring `snacks.json` & drinks, ~~not~~ definitely no karaoke!
+- Budget: 20-30 EUR per person = fair
+
+> Quote of the day: "it's not a bug, it's a feature."
+
+```python
+def total(people: int) -> int:
+    return people * 25  # `average`
+```
+
+Let me know if I missed anything_else. 1. Yes 2. No 3. Maybe!
+
+"""
+
+class MarkdownV2Error(ValueError):
+    pass
+
+def check_markdown_v2(text: str):
+    """Raise MarkdownV2Error where Telegram's MarkdownV2 parser would reject the text."""
+    entities = []
+    index = 0
+    line_start = True
+    while index < len(text):
+        character = text[index]
+
+        if character == '\\':
+            if index + 1 == len(text):
+                raise MarkdownV2Error(f"dangling escape at {index}")
+            index += 2
+            line_start = False
+            continue
+
+        if character == '`':
+            delimiter = '```' if text.startswith('```', index) else '`'
+            index = _skip_code(text=text, index=index + len(delimiter), delimiter=delimiter)
+        elif character in '*~_' or text.startswith('||', index):
+            marker = '__' if text.startswith('__', index) else '||' if character == '|' else character
+            if entities and entities[-1] == marker:
+                entities.pop()
+            elif marker in entities:
+                raise MarkdownV2Error(f"improperly nested {marker!r} at {index}")
+            else:
+                entities.append(marker)
+            index += len(marker) - 1
+        elif character == '[':
+            entities.append('[')
+        elif character == ']':
+            if not entities or entities[-1] != '[':
+                raise MarkdownV2Error(f"unexpected ']' at {index}")
+            if not text.startswith('(', index + 1):
+                raise MarkdownV2Error(f"link without url at {index}")
+            entities.pop()
+            index = _skip_url(text=text, index=index + 2)
+        elif character == '>' and line_start:
+            pass
+        elif character in SPECIAL_CHARACTERS:
+            raise MarkdownV2Error(f"unescaped {character!r} at {index}")
+
+        line_start = character == '\n'
+        index += 1
+
+    if entities:
+        raise MarkdownV2Error(f"unclosed entities: {entities}")
+
+def _skip_code(text: str, index: int, delimiter: str) -> int:
+    while index < len(text):
+        if text[index] == '\\':
+            if index + 1 == len(text) or text[index + 1] not in '`\\':
+                raise MarkdownV2Error(f"invalid escape in code at {index}")
+            index += 2
+        elif text.startswith(delimiter, index):
+            return index + len(delimiter) - 1
+        elif text[index] == '`':
+            raise MarkdownV2Error(f"unescaped '`' in code at {index}")
+        else:
+            index += 1
+    raise MarkdownV2Error(f"unclosed {delimiter!r}")
+
+def _skip_url(text: str, index: int) -> int:
+    while index < len(text):
+        if text[index] == '\\':
+            index += 2
+        elif text[index] == ')':
+            return index
+        else:
+            index += 1
+    raise MarkdownV2Error("unclosed link url")
+
+def fuzz(cases: int, seed: int):
+    rng = random.Random(seed)
+    for case in range(cases):
+        text = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 40)))
+        converted = to_markdown_v2(text)
+        try:
+            check_markdown_v2(converted)
+        except MarkdownV2Error as e:
+            raise AssertionError(f"case {case} failed: {e}\ninput: {text!r}\noutput: {converted!r}") from e
+    print(f"fuzz - cases: {cases} - failures: 0")
+
+def benchmark(sizes: list[int]):
+    for size in sizes:
+        text = (LLM_REPLY * (size // len(LLM_REPLY) + 1))[:size]
+        check_markdown_v2(to_markdown_v2(text))
+
+        iterations = max(1, 1_000_000 // size)
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            to_markdown_v2(text)
+        elapsed = (time.perf_counter() - started_at) / iterations
+        print(f"size: {size:>9,} chars - {elapsed * 1000:>9.3f} ms - {size / elapsed / 1e6:>6.1f} M chars/s")
+
+    # Unclosed markers on a single line are the worst case for backtracking
+    for size in sizes:
+        text = ('**a ' * (size // 4 + 1))[:size]
+        started_at = time.perf_counter()
+        to_markdown_v2(text)
+        elapsed = time.perf_counter() - started_at
+        print(f"unclosed markers - size: {size:>9,} chars - {elapsed * 1000:>9.3f} ms")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fuzz and benchmark the MarkdownV2 converter.")
+    arg_parser.add_argument("--cases", type=int, default=100000, help="Random inputs to fuzz")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the fuzzer")
+    arg_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000, 1000000],
+        help="Reply sizes in characters to benchmark"
+    )
+    args = arg_parser.parse_args()
+    fuzz(cases=args.cases, seed=args.seed)
+    benchmark(sizes=args.sizes)
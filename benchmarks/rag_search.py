@@ -0,0 +1,95 @@
+"""Benchmark vector search latency of the LanceDB and matrix engines across chat sizes.
+
+For every chat size a chat of random normalized embeddings is stored, alongside other
+chats of the same size, and searched with both engines. The first matrix search of a chat
+builds its files from LanceDB, so it is timed separately from the steady state.
+
+Usage:
+    python3 benchmarks/rag_search.py --sizes 1000 10000 100000 --dimensions 1536
+"""
+import argparse
+from datetime import timedelta
+import numpy as np
+from pathlib import Path
+import pyarrow as pa
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+from rag import embeddings_schema, LANCEDB_ENGINE, MATRIX_ENGINE, Rag
+
+class RandomEmbeddingClient:
+    def __init__(self, dimensions: int):
+        self.model = "random"
+        self.dimensions = dimensions
+
+def _random_embeddings(rng: np.random.Generator, count: int, dimensions: int) -> np.ndarray:
+    embeddings = rng.standard_normal((count, dimensions), dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def _fill(rag: Rag, rng: np.random.Generator, chats: int, size: int, dimensions: int):
+    now = time.time()
+    for chat_id in range(chats):
+        embeddings = _random_embeddings(rng=rng, count=size, dimensions=dimensions)
+        rag.table.add(pa.Table.from_pydict(
+            {
+                "id": np.arange(size, dtype=np.int64),
+                "chat_id": np.full(size, chat_id, dtype=np.int64),
+                "created_at": now - 86_400 + np.arange(size, dtype=np.float64) * 60_000 / size,
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), dimensions),
+            },
+            schema=embeddings_schema(dimensions=dimensions)
+        ))
+
+def _time_searches(rag: Rag, queries: np.ndarray) -> list[float]:
+    latencies = []
+    for query in queries:
+        started_at = time.perf_counter()
+        rag._vector_search(chat_id=0, embedding=query.tolist(), before=timedelta(hours=1))
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+def _benchmark(size: int, chats: int, dimensions: int, queries: int, limit: int):
+    rng = np.random.default_rng(size)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory)
+        database = Database(path=path, admin_user_id=1, bot_id=2, bot_name="bot", bot_username="bot")
+        embedding_client = RandomEmbeddingClient(dimensions=dimensions)
+
+        lancedb_rag = Rag(path=path, embedding_client=embedding_client, limit=limit, database=database)
+        _fill(rag=lancedb_rag, rng=rng, chats=chats, size=size, dimensions=dimensions)
+        matrix_rag = Rag(
+            path=path, 
+            embedding_client=embedding_client, 
+            limit=limit, 
+            database=database, 
+            engine=MATRIX_ENGINE
+        )
+
+        query_embeddings = _random_embeddings(rng=rng, count=queries, dimensions=dimensions)
+        build_seconds = _time_searches(rag=matrix_rag, queries=query_embeddings[:1])[0]
+
+        for engine, rag in ((LANCEDB_ENGINE, lancedb_rag), (MATRIX_ENGINE, matrix_rag)):
+            latencies = sorted(_time_searches(rag=rag, queries=query_embeddings))
+            print(
+                f"size: {size:>7} - engine: {engine:<7} - "
+                f"p50: {statistics.median(latencies) * 1000:>8.2f}ms - "
+                f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:>8.2f}ms"
+            )
+        print(f"size: {size:>7} - matrix build on first search: {build_seconds * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark RAG vector search engines.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Messages per chat")
+    arg_parser.add_argument("--chats", type=int, default=3, help="Chats stored per size")
+    arg_parser.add_argument("--dimensions", type=int, default=1536, help="Embedding dimensions")
+    arg_parser.add_argument("--queries", type=int, default=100, help="Searches timed per engine")
+    arg_parser.add_argument("--limit", type=int, default=10, help="Results per search")
+    args = arg_parser.parse_args()
+
+    for size in args.sizes:
+        _benchmark(size=size, chats=args.chats, dimensions=args.dimensions, queries=args.queries, limit=args.limit)
@@ -0,0 +1,84 @@
+"""Benchmark validation throughput of the structured LLM Response.
+
+Compares parsing the raw JSON an LLM returns with `Response.model_validate_json`, which
+parses and validates in one pass inside pydantic-core, against decoding it with `json`
+first, and the precompiled reaction lookup against the previous per-call
+`_value2member_map_` lookups and latin-1 re-decoding.
+
+Usage:
+    python3 benchmarks/response_validation.py --iterations 100000
+"""
+import argparse
+import json
+from pathlib import Path
+import sys
+from telegram.constants import ReactionEmoji
+import time
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm.client import Response
+
+def _previous_normalize_reaction(value):
+    if value in (None, ""):
+        return None
+
+    if isinstance(value, ReactionEmoji):
+        return value
+
+    if isinstance(value, str):
+        if value in ReactionEmoji._value2member_map_:
+            return ReactionEmoji(value)
+
+        try:
+            decoded = value.encode('latin-1').decode('utf-8')
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            return None
+
+        if decoded in ReactionEmoji._value2member_map_:
+            return ReactionEmoji(decoded)
+
+    return None
+
+def _payloads() -> list[str]:
+    reaction = ReactionEmoji.FIRE.value
+    return [
+        json.dumps({"message": "Sounds good to me!", "reaction": reaction, "reaction_strength": 0.8}),
+        json.dumps({"message": "Hm.", "reaction": None, "reaction_strength": 0.1}),
+        # Mis-decoded emoji, as some models return it
+        json.dumps({
+            "message": "Ha, classic.",
+            "reaction": reaction.encode('utf-8').decode('latin-1'),
+            "reaction_strength": 0.6
+        }),
+        json.dumps({"message": "Ok", "reaction": "not an emoji", "reaction_strength": 0.3}),
+    ]
+
+def _measure(name: str, func: Callable[[str], object], payloads: list[str], iterations: int):
+    started_at = time.perf_counter()
+    for index in range(iterations):
+        func(payloads[index % len(payloads)])
+    elapsed = time.perf_counter() - started_at
+    print(f"{name:<40} {iterations / elapsed:>12,.0f} /s {elapsed / iterations * 1e6:>8.2f} µs")
+
+def benchmark(iterations: int):
+    payloads = _payloads()
+
+    # Both paths must agree before timing them
+    for payload in payloads:
+        value = json.loads(payload)["reaction"]
+        assert Response.normalize_reaction(value) == _previous_normalize_reaction(value)
+        assert Response.model_validate_json(payload) == Response.model_validate(json.loads(payload))
+
+    reactions = [json.loads(payload)["reaction"] for payload in payloads]
+    _measure("normalize_reaction (previous)", _previous_normalize_reaction, reactions, iterations)
+    _measure("normalize_reaction (lookup table)", Response.normalize_reaction, reactions, iterations)
+    _measure("json.loads + model_validate", lambda payload: Response.model_validate(json.loads(payload)), payloads, iterations)
+    _measure("model_validate_json", Response.model_validate_json, payloads, iterations)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark validation throughput of the LLM Response model.")
+    arg_parser.add_argument("--iterations", type=int, default=100000, help="Validations per measurement")
+    args = arg_parser.parse_args()
+    benchmark(iterations=args.iterations)
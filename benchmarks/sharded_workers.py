@@ -0,0 +1,90 @@
+"""Benchmark update throughput of the sharded worker pool across worker counts.
+
+Each synthetic update goes through the CPU-bound part of handling a message (JSON
+decoding, markdown sanitizing and base64 encoding), so the numbers show how throughput
+scales once that work is spread over several cores.
+
+Usage:
+    python3 benchmarks/sharded_workers.py --updates 20000 --chats 200 --workers 1 2 4 8
+"""
+import argparse
+import base64
+import json
+from multiprocessing import get_context
+from multiprocessing.queues import Queue
+import os
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers import to_markdown_v2
+from workers import shard_key, ShardedWorkerPool
+
+REPLY_TEXT = "# Heading\n\n**Bold** text with a [link](https://example.com) and some `code`.\n" * 20
+
+def _handle(update_json: dict) -> int:
+    message = json.loads(json.dumps(update_json))["message"]
+    reply = to_markdown_v2(REPLY_TEXT + message["text"])
+    return len(base64.b64encode(reply.encode("utf-8")))
+
+def _run_worker(worker_index: int, queue: Queue, ready_queue: Queue, done_queue: Queue):
+    ready_queue.put(worker_index)
+
+    processed = 0
+    while (item := queue.get()) is not None:
+        _handle(item)
+        processed += 1
+
+    done_queue.put(processed)
+
+def _build_updates(count: int, chats: int) -> list[dict]:
+    return [
+        {
+            "update_id": index,
+            "message": {
+                "message_id": index,
+                "date": 0,
+                "chat": {"id": -1000 - index % chats, "type": "group"},
+                "from": {"id": index % chats, "is_bot": False, "first_name": "user"},
+                "text": f"message {index} " * 10,
+            },
+        }
+        for index in range(count)
+    ]
+
+def _benchmark(workers: int, updates: list[dict]) -> float:
+    context = get_context("spawn")
+    ready_queue, done_queue = context.Queue(), context.Queue()
+
+    pool = ShardedWorkerPool(num_workers=workers, target=_run_worker, args=(ready_queue, done_queue))
+    pool.start()
+    for _ in range(workers):
+        ready_queue.get()
+
+    started_at = time.perf_counter()
+    for update_json in updates:
+        pool.dispatch(key=shard_key(update_json), item=update_json)
+    pool.stop()
+    processed = sum(done_queue.get() for _ in range(workers))
+    elapsed = time.perf_counter() - started_at
+
+    assert processed == len(updates)
+    return len(updates) / elapsed
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark sharded worker pool throughput.")
+    arg_parser.add_argument("--updates", type=int, default=20_000, help="Number of synthetic updates")
+    arg_parser.add_argument("--chats", type=int, default=200, help="Number of distinct chats")
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to compare")
+    args = arg_parser.parse_args()
+
+    updates = _build_updates(count=args.updates, chats=args.chats)
+    print(f"cpu_count: {os.cpu_count()} - updates: {args.updates} - chats: {args.chats}")
+
+    baseline = None
+    for workers in args.workers:
+        throughput = _benchmark(workers=workers, updates=updates)
+        baseline = baseline or throughput
+        print(f"workers: {workers:>2} - updates/sec: {throughput:>10.0f} - speedup: {throughput / baseline:.2f}x")
@@ -1,9 +1,10 @@
 import asyncio
 import base64
-from datetime import timedelta
+from datetime import datetime, timedelta
 from functools import partial
 import logging
 from pathlib import Path
+from typing import List
 from telegram import (
     File, 
     InlineKeyboardButton, 
@@ -19,34 +20,26 @@ from telegram.ext import (
     CallbackQueryHandler, 
     CommandHandler,
     ContextTypes,
-    ExtBot, 
     filters, 
     MessageHandler
 )
 
-from database import Database, Message, User
-from helpers import sanitize_markdown
-from logger import log_formatter, logger
-from llm.client import LLMClient
+from alerts import AdminAlertHandler
+from database import Database, Message, Summary, User
+from logger import add_log_handler, BotFilter, current_bot, log_formatter, logger, remove_log_handler
+from metrics import Pricing, record_llm_usage, timed
+from llm.client import LLMClient, Response
 from prompt import generate_prompt
-from rag import Rag
+from rag import HYBRID_MODE, Rag
+from sender import ReplySender
+from stages import StageGraph
+from summary import Summarizer
 from vision.client import VisionClient
 
 ACCESS_APPROVE_PREFIX = 'approve'
 ACCESS_DENY_PREFIX = 'deny'
 ACCESS_DELIMITER = '_'
 
-# Class to handle error logs and send an alert
-class AdminAlertHandler(logging.Handler):
-    def __init__(self, admin_user_id: int, bot: ExtBot):
-        super().__init__()
-        self.admin_user_id = admin_user_id
-        self.bot = bot
-
-    def emit(self, record):
-        log_entry = self.format(record)
-        asyncio.create_task(self.bot.send_message(text=log_entry, chat_id=self.admin_user_id))
-
 class TelegramBot:
 
     def __init__(
@@ -63,7 +56,9 @@ class TelegramBot:
         database: Database,
         llm: LLMClient, 
         vision: VisionClient, 
-        rag: Rag
+        rag: Rag,
+        summarizer: Summarizer | None = None,
+        llm_pricing: Pricing | None = None
     ):
         self.id = id
         self.name = name
@@ -77,14 +72,20 @@ class TelegramBot:
         self.llm = llm
         self.vision = vision
         self.rag = rag
+        self.summarizer = summarizer
+        self.llm_pricing = llm_pricing
+        self.sender = ReplySender(database=database)
         
         self.images_path = path / "images"
         self.images_path.mkdir(exist_ok=True)
 
-        # Set up custom alerts for error logs
-        admin_handler = AdminAlertHandler(bot=self.telegram.bot, admin_user_id=admin_user_id)
-        admin_handler.setLevel(logging.ERROR)
-        admin_handler.setFormatter(log_formatter)
+        # Set up custom alerts for error logs, sent as digests from start()
+        self.admin_alerts = AdminAlertHandler(bot=self.telegram.bot, admin_user_id=admin_user_id)
+        self.admin_alerts.setLevel(logging.ERROR)
+        self.admin_alerts.setFormatter(log_formatter)
+
+        # The listener is shared by all bots of a process, only this bot's errors go to its admin
+        self.admin_alerts.addFilter(BotFilter(bot=username))
 
     async def start(self):
         self.telegram.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE, partial(self.on_edit_text)))
@@ -96,6 +97,28 @@ class TelegramBot:
         commands = []
         await self.telegram.bot.set_my_commands(commands=commands)
 
+        # Apply queued embedding edits in the background
+        self._rag_updates_task = asyncio.create_task(self.rag.run_updates())
+
+        # Error logs are buffered on the logging thread and sent from here
+        add_log_handler(self.admin_alerts)
+        self._admin_alerts_task = asyncio.create_task(self.admin_alerts.run())
+
+    async def stop(self):
+        for task in (self._rag_updates_task, self._admin_alerts_task):
+            task.cancel()
+        await asyncio.gather(self._rag_updates_task, self._admin_alerts_task, return_exceptions=True)
+
+        # Edits queued since the last batch would be lost otherwise
+        try:
+            await asyncio.to_thread(self.rag.apply_updates)
+        except Exception as e:
+            logger.error('rag_updates_failed - error: %s', e)
+
+        # A stopped bot no longer collects alerts, the ones already collected are sent
+        remove_log_handler(self.admin_alerts)
+        await self.admin_alerts.flush_alerts()
+
     # -----------------------------------------
     # Commands
     # -----------------------------------------
@@ -104,6 +127,7 @@ class TelegramBot:
         if update.message is None or update.message.from_user is None:
             return
 
+        current_bot.set(self.username)
         user = await self._ensure_access(telegram_user=update.message.from_user)
         if user is None:
             return
@@ -119,16 +143,17 @@ class TelegramBot:
             return
         
         message, from_user, text = update.message, update.message.from_user, update.message.text
+        current_bot.set(self.username)
 
         # Ensure user access has been approved
         user = await self._ensure_access(telegram_user=from_user)
         if user is None:
             return   
 
-        logger.info(f'msg_in - chat_id: {message.chat_id} - msg_id: {message.id} - user_id: {from_user.id}')
-        logger.debug(f'msg_text: {message.text}')
+        logger.info('msg_in - chat_id: %s - msg_id: %s - user_id: %s', message.chat_id, message.id, from_user.id)
+        logger.debug('msg_text: %s', message.text)
 
-        with self.database.Session.begin() as session:
+        with timed('persist'), self.database.Session.begin() as session:
             # Store message
             new_message = Message(
                 id=message.id,
@@ -140,11 +165,16 @@ class TelegramBot:
             )
 
             session.add(new_message)
-            logger.info(f'msg_in_persisted - chat_id: {message.chat_id} - msg_id: {message.id}')
+            logger.info('msg_in_persisted - chat_id: %s - msg_id: %s', message.chat_id, message.id)
+
+        # Condense older messages in the background
+        if self.summarizer:
+            self.summarizer.schedule(chat_id=message.chat_id)
 
         try:
             # Generate and store the message's embedding
-            embedding = self.rag.embed(
+            embed = partial(
+                self._embed,
                 message_id=message.id, 
                 chat_id=message.chat_id, 
                 text=text, 
@@ -161,61 +191,45 @@ class TelegramBot:
 
             # Conditions to ask LLM for a reply
             if bot_mentioned or is_private_chat or is_reply_to_bot:
-                await context.bot.send_chat_action(message.chat_id, action=ChatAction.TYPING)
-                logger.info(f'llm_request - chat_id: {message.chat_id} - msg_id: {message.id}')
-
-                # Get RAG messages for LLM context
-                rag_message_ids = self.rag.search(
-                    chat_id=message.chat_id, 
-                    embedding=embedding, 
-                    before=self.context_window
+                logger.info('llm_request - chat_id: %s - msg_id: %s', message.chat_id, message.id)
+
+                # Only the RAG search waits on the embedding, other context is loaded alongside it
+                stages = StageGraph(label=f'chat_id: {message.chat_id} - msg_id: {message.id}')
+                stages.add('typing', partial(context.bot.send_chat_action, message.chat_id, action=ChatAction.TYPING))
+                stages.add('embedding', embed)
+                stages.add(
+                    'rag_messages', 
+                    partial(self._get_rag_messages, chat_id=message.chat_id, message_id=message.id, text=text), 
+                    depends_on=['embedding']
                 )
-                context_messages = self.database.get_messages(chat_id=message.chat_id, message_ids=rag_message_ids)
-
-                # Get recent messages for LLM context
-                context_messages.extend(
-                    self.database.get_messages_since(chat_id=message.chat_id, since=self.context_window)
+                stages.add('summary', partial(self._get_summary, chat_id=message.chat_id))
+                stages.add(
+                    'recent_messages', 
+                    partial(self._get_recent_messages, chat_id=message.chat_id), 
+                    depends_on=['summary']
                 )
-
-                # Make LLM request
-                llm_response = self.llm.generate_response(
-                    prompt=generate_prompt(
-                        members=self.database.get_members(chat_id=message.chat_id),
-                        bot_name=self.name,
-                        bot_identity=self.identity
-                    ),
-                    messages=context_messages
+                stages.add('members', partial(asyncio.to_thread, self.database.get_members, chat_id=message.chat_id))
+                stages.add(
+                    'llm_response', 
+                    partial(self._generate_response, chat_id=message.chat_id), 
+                    depends_on=['summary', 'rag_messages', 'recent_messages', 'members']
                 )
-                logger.info(f'llm_response - chat_id: {message.chat_id} - msg_id: {message.id}')
-                logger.debug(f'\n{llm_response.model_dump_json(indent=4)}')
+                llm_response: Response = (await stages.run())['llm_response']
+                logger.info('llm_response - chat_id: %s - msg_id: %s', message.chat_id, message.id)
+                logger.debug('\n%s', llm_response.model_dump_json(indent=4))
 
                 # Send reaction
                 if llm_response.reaction and llm_response.reaction_strength >= self.reaction_threshold:
                     await message.set_reaction(llm_response.reaction)
-                    logger.info(f'msg_reaction - chat_id: {message.chat_id} - msg_id: {message.id}')
+                    logger.info('msg_reaction - chat_id: %s - msg_id: %s', message.chat_id, message.id)
 
-                # Send LLM reply as message
-                llm_sent_message = await message.reply_text(
-                    sanitize_markdown(llm_response.message), 
-                    parse_mode='Markdown'
-                )
-                logger.info(f'msg_out - chat_id: {message.chat_id} - msg_id: {message.id}')
-
-                with self.database.Session.begin() as session:
-                    # Store LLM reply as message
-                    if llm_sent_message.from_user:    
-                        llm_message_record = Message(
-                            id=llm_sent_message.id, 
-                            user_id=llm_sent_message.from_user.id, 
-                            chat_id=message.chat_id, 
-                            text=llm_response.message,
-                            created_at=llm_sent_message.date,
-                            reply_to_id=message.id
-                        )
-                        session.add(llm_message_record)
-                        logger.info(f'msg_out_persisted - chat_id: {message.chat_id} - msg_id: {message.id}')
+                # Send and store LLM reply, split into several messages if it's too long
+                with timed('send'):
+                    await self.sender.reply(message=message, text=llm_response.message)
+            else:
+                await embed()
         except Exception as e:
-            logger.error(f'msg_failed - chat_id: {message.chat_id} - msg_id: {message.id} - error: {e}')
+            logger.error('msg_failed - chat_id: %s - msg_id: %s - error: %s', message.chat_id, message.id, e)
 
     # -----------------------------------------
     # Edit Text
@@ -225,10 +239,22 @@ class TelegramBot:
         if update.edited_message is None or update.edited_message.text is None:
             return
 
-        with self.database.Session.begin() as session:
-            message_id, message_text = update.edited_message.message_id, update.edited_message.text
-            message = session.query(Message).filter(Message.id == message_id).one()
-            message.text = message_text
+        edited_message = update.edited_message
+        current_bot.set(self.username)
+
+        with timed('persist'), self.database.Session.begin() as session:
+            message = session.get(Message, (edited_message.message_id, edited_message.chat_id))
+            if message is None:
+                return
+            message.text = edited_message.text
+
+        # Re-embedded in the background, batched with other edits
+        self.rag.update(
+            message_id=edited_message.message_id, 
+            chat_id=edited_message.chat_id, 
+            created_at=edited_message.date, 
+            text=edited_message.text
+        )
 
     # -----------------------------------------
     # Photo
@@ -239,6 +265,7 @@ class TelegramBot:
             return
         
         message, from_user, caption = update.message, update.message.from_user, update.message.caption
+        current_bot.set(self.username)
 
         # Ensure user access has been approved
         user = await self._ensure_access(telegram_user=from_user)
@@ -270,12 +297,14 @@ class TelegramBot:
                 base64_image = base64.b64encode(image.read()).decode('utf-8')
 
             # OpenAI Vision
-            vision_response = self.vision.analyze(
-                base64_image=base64_image, 
-                prompt="Give a detailed description of this image. Including identification of any people or locations."
-            )
+            with timed('vision'):
+                vision_response = await asyncio.to_thread(
+                    self.vision.analyze,
+                    base64_image=base64_image, 
+                    prompt="Give a detailed description of this image. Including identification of any people or locations."
+                )
 
-            with self.database.Session.begin() as session:
+            with timed('persist'), self.database.Session.begin() as session:
                 # Store a text message of computer vision output
                 new_message = Message(
                     id=message.id, 
@@ -288,45 +317,39 @@ class TelegramBot:
                 )
                 session.add(new_message)
 
+            # Condense older messages in the background
+            if self.summarizer:
+                self.summarizer.schedule(chat_id=message.chat_id)
+
             # Conditions to ask LLM for a reply
             if bot_mentioned or is_private_chat or is_reply_to_bot:
-                await context.bot.send_chat_action(message.chat_id, action=ChatAction.TYPING)
-
-                # Make LLM request
-                llm_response = self.llm.generate_response(
-                    prompt=generate_prompt(
-                        members=self.database.get_members(chat_id=message.chat_id),
-                        bot_name=self.name,
-                        bot_identity=self.identity
-                    ),
-                    messages=self.database.get_messages_since(chat_id=message.chat_id, since=timedelta(hours=12))
+                # Same context as a text reply, without a RAG search as the photo isn't embedded
+                stages = StageGraph(label=f'chat_id: {message.chat_id} - msg_id: {message.id}')
+                stages.add('typing', partial(context.bot.send_chat_action, message.chat_id, action=ChatAction.TYPING))
+                stages.add('summary', partial(self._get_summary, chat_id=message.chat_id))
+                stages.add(
+                    'recent_messages', 
+                    partial(self._get_recent_messages, chat_id=message.chat_id), 
+                    depends_on=['summary']
+                )
+                stages.add('members', partial(asyncio.to_thread, self.database.get_members, chat_id=message.chat_id))
+                stages.add(
+                    'llm_response', 
+                    partial(self._generate_response, chat_id=message.chat_id, rag_messages=[]), 
+                    depends_on=['summary', 'recent_messages', 'members']
                 )
-                logger.info(f'\n{llm_response.model_dump_json(indent=4)}')
+                llm_response: Response = (await stages.run())['llm_response']
+                logger.info('\n%s', llm_response.model_dump_json(indent=4))
 
                 # Send reaction
                 if llm_response.reaction and llm_response.reaction_strength >= self.reaction_threshold:
                     await message.set_reaction(llm_response.reaction)
 
-                # Send LLM reply as message
-                llm_sent_message = await message.reply_text(
-                    sanitize_markdown(llm_response.message), 
-                    parse_mode='Markdown'
-                )
-
-                # Store LLM reply as message
-                if llm_sent_message.from_user:
-                    with self.database.Session.begin() as session:
-                        llm_message_record = Message(
-                        id=llm_sent_message.id, 
-                        user_id=llm_sent_message.from_user.id, 
-                        chat_id=message.chat_id, 
-                        text=llm_response.message,
-                        created_at=llm_sent_message.date,
-                        reply_to_id=message.id
-                    )
-                    session.add(llm_message_record)
+                # Send and store LLM reply, split into several messages if it's too long
+                with timed('send'):
+                    await self.sender.reply(message=message, text=llm_response.message)
         except Exception as e:
-            logger.error(f'msg_failed - chat_id: {message.chat_id} - msg_id: {message.id} - error: {e}')
+            logger.error('msg_failed - chat_id: %s - msg_id: %s - error: %s', message.chat_id, message.id, e)
 
     # -----------------------------------------
     # Callback
@@ -367,8 +390,100 @@ class TelegramBot:
         # Acknowledge the callback query
         await update.callback_query.answer()
 
+    # -----------------------------------------
+    # Reply Stages
+    # -----------------------------------------
+
+    async def _embed(self, message_id: int, chat_id: int, text: str, created_at: datetime) -> List[float] | None:
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(
+                    self.rag.embed, 
+                    message_id=message_id, 
+                    chat_id=chat_id, 
+                    text=text, 
+                    created_at=created_at
+                ),
+                timeout=self.rag.embedding_timeout
+            )
+        except Exception as e:
+            if self.rag.mode != HYBRID_MODE:
+                raise
+
+            # Hybrid search can still fall back to full text search, the message is
+            # embedded with the next batch of updates so vector search finds it later
+            logger.warning('embedding_failed - chat_id: %s - msg_id: %s - error: %r', chat_id, message_id, e)
+            self.rag.update(message_id=message_id, chat_id=chat_id, created_at=created_at, text=text)
+            return None
+
+    async def _get_rag_messages(
+        self, 
+        chat_id: int, 
+        message_id: int, 
+        text: str, 
+        embedding: List[float] | None
+    ) -> List[Message]:
+        rag_results = await asyncio.to_thread(
+            self.rag.search,
+            chat_id=chat_id, 
+            embedding=embedding, 
+            before=self.context_window,
+            text=text,
+            message_id=message_id
+        )
+        return await asyncio.to_thread(
+            self.database.get_messages, 
+            chat_id=chat_id, 
+            message_ids=set(rag_results.ids.tolist())
+        )
+
+    async def _get_summary(self, chat_id: int) -> Summary | None:
+        if self.summarizer is None:
+            return None
+        
+        # Each summary carries over the previous one, only the latest is sent
+        return await asyncio.to_thread(self.database.get_latest_summary, chat_id=chat_id, since=self.context_window)
+
+    async def _get_recent_messages(self, chat_id: int, summary: Summary | None) -> List[Message]:
+        # Messages covered by the summary are left out
+        return await asyncio.to_thread(
+            self.database.get_messages_since, 
+            chat_id=chat_id, 
+            since=self.context_window,
+            after_id=summary.end_message_id if summary else None
+        )
+
+    async def _generate_response(
+        self, 
+        chat_id: int,
+        summary: Summary | None,
+        rag_messages: List[Message], 
+        recent_messages: List[Message], 
+        members: List[User]
+    ) -> Response:
+        with timed('llm'):
+            response = await asyncio.to_thread(
+                self.llm.generate_response,
+                prompt=generate_prompt(
+                    members=members,
+                    bot_name=self.name,
+                    bot_identity=self.identity,
+                    summary=summary
+                ),
+                messages=rag_messages + recent_messages
+            )
+
+        if response.usage:
+            record_llm_usage(
+                chat_id=chat_id, 
+                input_tokens=response.usage.input_tokens, 
+                output_tokens=response.usage.output_tokens, 
+                pricing=self.llm_pricing
+            )
+        return response
+
     async def _ensure_access(self, telegram_user: TelegramUser) -> User | None:
-        with self.database.Session.begin() as session:
+        with timed('access_check'), self.database.Session.begin() as session:
             user = session.query(User).filter_by(id=telegram_user.id).first()
             if user:
                 # Store metadata as approval only stores id
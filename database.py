@@ -1,13 +1,76 @@
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from sqlalchemy import BigInteger, create_engine, DateTime, ForeignKey, ForeignKeyConstraint, select, String, Text
+import re
+from sqlalchemy import (
+    and_, 
+    BigInteger, 
+    bindparam, 
+    create_engine, 
+    DateTime, 
+    event, 
+    ForeignKey, 
+    Integer, 
+    ForeignKeyConstraint, 
+    literal_column, 
+    select, 
+    String, 
+    Text, 
+    text
+)
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship, sessionmaker
+from sqlalchemy.sql.elements import ColumnElement
 from typing import Set
 
 from logger import logger
+from metrics import timed
 
 Base = declarative_base()
 
+FTS_TERM_PATTERN = re.compile(r"\w+")
+FTS_MAX_TERMS = 32
+FTS_SEARCH_QUERY = text("""
+    SELECT messages.id FROM messages_fts
+    JOIN messages ON messages.rowid = messages_fts.rowid
+    WHERE messages_fts MATCH :query
+    AND messages.chat_id = :chat_id
+    AND messages.created_at < :cutoff
+    ORDER BY messages_fts.rank
+    LIMIT :limit
+""").bindparams(bindparam("cutoff", type_=DateTime(timezone=True)))
+
+# Walks reply_to_id both ways, parents through the primary key and replies through the
+# (chat_id, reply_to_id) index
+THREAD_QUERY = text("""
+    WITH RECURSIVE thread(id, depth) AS (
+        SELECT id, 0 FROM messages WHERE chat_id = :chat_id AND id IN :message_ids
+        UNION
+        SELECT messages.reply_to_id, thread.depth + 1 FROM thread
+        JOIN messages ON messages.id = thread.id AND messages.chat_id = :chat_id
+        WHERE messages.reply_to_id IS NOT NULL AND thread.depth < :depth
+        UNION
+        SELECT messages.id, thread.depth + 1 FROM thread
+        JOIN messages ON messages.chat_id = :chat_id AND messages.reply_to_id = thread.id
+        WHERE thread.depth < :depth
+    )
+    SELECT messages.id FROM thread
+    JOIN messages ON messages.id = thread.id AND messages.chat_id = :chat_id
+    WHERE messages.created_at < :cutoff
+    AND messages.id NOT IN :message_ids
+    GROUP BY messages.id
+    ORDER BY MIN(thread.depth), messages.created_at DESC
+    LIMIT :limit
+""").bindparams(
+    bindparam("message_ids", expanding=True), 
+    bindparam("cutoff", type_=DateTime(timezone=True))
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while another process writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
 # -----------------------------------------
 # User
 # -----------------------------------------
@@ -76,6 +139,40 @@ class Message(Base):
         self.image_path = image_path
         self.reply_to_id = reply_to_id        
 
+def embedded_messages(bot_id: int) -> ColumnElement[bool]:
+    """Filter of the messages embedded for RAG: text sent by users, neither photos nor the bot's own replies."""
+    return and_(Message.image_path.is_(None), Message.user_id != bot_id)
+
+# -----------------------------------------
+# Summary
+# -----------------------------------------
+
+class Summary(Base):
+    __tablename__ = "summaries"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    start_message_id: Mapped[int] = mapped_column(BigInteger)
+    end_message_id: Mapped[int] = mapped_column(BigInteger)
+    end_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __init__(
+        self, 
+        chat_id: int, 
+        text: str, 
+        start_message_id: int, 
+        end_message_id: int, 
+        end_at: datetime, 
+        created_at: datetime
+    ):
+        self.chat_id = chat_id
+        self.text = text
+        self.start_message_id = start_message_id
+        self.end_message_id = end_message_id
+        self.end_at = end_at
+        self.created_at = created_at
+
 # -----------------------------------------
 # Database
 # -----------------------------------------
@@ -86,71 +183,185 @@ class Database:
     # -----------------------------------------
 
     def __init__(self, path: Path, admin_user_id: int, bot_id: int, bot_name: str, bot_username: str):
-        self._engine = create_engine(f"sqlite:///{path / 'bot.db'}", future=True)
+        self.bot_id = bot_id
+
+        # Worker processes share the database file, so wait on locks instead of failing
+        self._engine = create_engine(f"sqlite:///{path / 'bot.db'}", future=True, connect_args={"timeout": 30})
+        event.listen(self._engine, "connect", _set_sqlite_pragmas)
         self.Session = sessionmaker(bind=self._engine, future=True)
         self._create_tables_if_needed()
         self._create_indexes_if_needed()
+        self._create_full_text_index_if_needed()
         self._create_admin_user_if_needed(admin_user_id=admin_user_id)
         self._create_bot_user_if_needed(bot_id=bot_id, bot_name=bot_name, bot_username=bot_username)
 
     def _create_indexes_if_needed(self):
         with self._engine.begin() as conn:
             conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS messages_chat_id_idx ON messages(chat_id)")
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS messages_chat_id_reply_to_id_idx ON messages(chat_id, reply_to_id)"
+            )
+
+    def _create_full_text_index_if_needed(self):
+        # External content FTS5 index over messages.text, kept in sync by triggers
+        with self._engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).first() is not None
+
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages')"
+            )
+            conn.exec_driver_sql("""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text);
+                END
+            """)
+            conn.exec_driver_sql("""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                END
+            """)
+            conn.exec_driver_sql("""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+                    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                    INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text);
+                END
+            """)
+
+            # Index messages stored before full text search existed
+            if not exists:
+                conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+                logger.info("Full text index has been built")
 
     def _create_tables_if_needed(self):
         Base.metadata.create_all(bind=self._engine)
 
     def _create_admin_user_if_needed(self, admin_user_id: int):
-        session = self.Session()
-        try:
-            user = session.query(User).filter_by(id=admin_user_id).first()
-            if user is None:
-                session.add(User(id=admin_user_id))
-                session.commit()
+        # Insert or ignore, as several worker processes may start at once
+        with self.Session.begin() as session:
+            result = session.execute(insert(User).values(id=admin_user_id).on_conflict_do_nothing())
+            if result.rowcount:
                 logger.info("Admin user has been created")
-        except Exception as e:
-            session.rollback()
-            logger.error(f"An error occurred: {str(e)}")
-        finally:
-            session.close()
 
     def _create_bot_user_if_needed(self, bot_id: int, bot_name: str, bot_username: str):
-        session = self.Session()
-        try:
-            bot_user = session.query(User).filter_by(id=bot_id).first()
-            if bot_user is None:
-                session.add(User(id=bot_id, first_name=bot_name, username=bot_username))
-                session.commit()
+        with self.Session.begin() as session:
+            result = session.execute(
+                insert(User)
+                .values(id=bot_id, first_name=bot_name, username=bot_username)
+                .on_conflict_do_nothing()
+            )
+            if result.rowcount:
                 logger.info("Bot user has been created")
-        except Exception as e:
-            session.rollback()
-            logger.error(f"An error occurred: {str(e)}")
-        finally:
-            session.close()
 
     # Data Access
     # -----------------------------------------
 
-    def get_messages_since(self, chat_id: int, since: timedelta) -> list[Message]:
+    def get_messages_since(self, chat_id: int, since: timedelta, after_id: int | None = None) -> list[Message]:
         cutoff = datetime.now(timezone.utc) - since
-        with self.Session() as session:
-            return list(session.scalars(
-                select(Message)
-                .where(Message.chat_id == chat_id)
-                .where(Message.created_at >= cutoff)
-                .order_by(Message.created_at.asc())
-            ).all())
+        query = (
+            select(Message)
+            .where(Message.chat_id == chat_id)
+            .where(Message.created_at >= cutoff)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+        )
+
+        # Messages up to after_id are covered by a summary
+        if after_id is not None:
+            query = query.where(Message.id > after_id)
+
+        with timed("db_context"), self.Session() as session:
+            return list(session.scalars(query).all())
+
+    def get_latest_summary(self, chat_id: int, since: timedelta | None = None) -> Summary | None:
+        query = select(Summary).where(Summary.chat_id == chat_id)
+
+        # Summaries of messages that fell out of the context window are ignored
+        if since is not None:
+            query = query.where(Summary.end_at >= datetime.now(timezone.utc) - since)
+
+        with timed("db_context"), self.Session() as session:
+            return session.scalars(query.order_by(Summary.end_message_id.desc()).limit(1)).first()
         
     def get_messages(self, chat_id: int, message_ids: Set[int]) -> list[Message]:
-        with self.Session() as session:
+        with timed("db_context"), self.Session() as session:
             return list(session.scalars(
                 select(Message)
                 .where(Message.chat_id == chat_id, Message.id.in_(message_ids))
                 .order_by(Message.created_at.asc())
             ).all())
 
-    def get_members(self, chat_id: int) -> list[User]:
+    def search_messages(self, chat_id: int, query: str, before: timedelta, limit: int) -> list[int]:
+        """Full text search of a chat's messages older than `before`, ranked by BM25.
+
+        Args:
+            chat_id: The chat to search in.
+            query: Free text, every word of it is matched as a separate term.
+            before: Only messages created before now minus this window are searched.
+            limit: The maximum number of message ids to return.
+
+        Returns:
+            list[int]: Ids of the matching messages, best match first.
+        """
+        terms = list(dict.fromkeys(FTS_TERM_PATTERN.findall(query.lower())))[:FTS_MAX_TERMS]
+        if not terms:
+            return []
+
+        cutoff = datetime.now(timezone.utc) - before
         with self.Session() as session:
+            return list(session.scalars(
+                FTS_SEARCH_QUERY,
+                {
+                    # Quoted terms are matched literally instead of as FTS5 syntax
+                    "query": " OR ".join(f'"{term}"' for term in terms),
+                    "chat_id": chat_id,
+                    "cutoff": cutoff,
+                    "limit": limit
+                }
+            ).all())
+
+    def get_thread_ids(self, chat_id: int, message_ids: list[int], depth: int, before: timedelta, limit: int) -> list[int]:
+        """Reply-thread neighbours of messages, among messages older than `before`.
+
+        Walks `reply_to_id` in both directions (the messages replied to and the replies)
+        up to `depth` hops away from the given messages.
+
+        Args:
+            chat_id: The chat of the messages.
+            message_ids: The messages to find the neighbours of.
+            depth: The maximum number of hops from a given message.
+            before: Only neighbours created before now minus this window are returned.
+            limit: The maximum number of message ids to return.
+
+        Returns:
+            list[int]: Ids of the neighbours, closest first, excluding the given messages.
+        """
+        if not message_ids:
+            return []
+
+        cutoff = datetime.now(timezone.utc) - before
+        with self.Session() as session:
+            return list(session.scalars(
+                THREAD_QUERY,
+                {"chat_id": chat_id, "message_ids": message_ids, "depth": depth, "cutoff": cutoff, "limit": limit}
+            ).all())
+
+    def get_messages_after_rowid(self, after_rowid: int, limit: int) -> list[tuple[int, Message]]:
+        """Messages embedded for RAG of all chats in insertion order, each with its SQLite rowid to resume after."""
+        rowid = literal_column("messages.rowid")
+        with self.Session() as session:
+            return [
+                (row.rowid, row.Message)
+                for row in session.execute(
+                    select(rowid.label("rowid"), Message)
+                    .where(rowid > after_rowid, embedded_messages(bot_id=self.bot_id))
+                    .order_by(rowid)
+                    .limit(limit)
+                ).all()
+            ]
+
+    def get_members(self, chat_id: int) -> list[User]:
+        with timed("db_context"), self.Session() as session:
             return list(session.scalars(
                 select(User)
                 .join(Message, User.id == Message.user_id)
@@ -0,0 +1,56 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from typing import Any, Awaitable, Dict
+
+# Upper bound of updates processed at once across all chats. Updates waiting on their chat
+# also hold a slot, so it is kept well above the number of chats expected to be active at once.
+MAX_CONCURRENT_UPDATES = 256
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Update processor running different chats concurrently while serializing each chat.
+
+    Every chat gets its own lock, so a slow LLM reply in one chat no longer delays the
+    others, while messages within a chat are still persisted and replied to in the order
+    they were received. Locks are evicted as soon as a chat has no pending updates.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates=max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _key(self, update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+
+        if update.effective_chat:
+            return update.effective_chat.id
+
+        if update.effective_user:
+            return update.effective_user.id
+
+        return None
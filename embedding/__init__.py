@@ -0,0 +1,39 @@
+from .client import EmbeddingClient
+
+def parse_embedding(embedding_config_json) -> EmbeddingClient:
+    if "openai" in embedding_config_json:
+        openai_embedding_config_json = embedding_config_json["openai"]
+
+        api_key = openai_embedding_config_json.get("api_key")
+        if not api_key:
+            raise ValueError("openai embedding config must contain api_key")
+        
+        model = openai_embedding_config_json.get("model")
+        if not model:
+            raise ValueError("openai embedding config must contain model")
+        
+        dimensions = openai_embedding_config_json.get("dimensions")
+        if not dimensions:
+            raise ValueError("openai embedding config must contain dimensions")
+        
+        # Providers are imported on demand, so only the configured one is loaded
+        from .openai import OpenAIEmbeddingClient
+
+        return OpenAIEmbeddingClient(api_key=api_key, model=model, dimensions=dimensions)
+    elif "local" in embedding_config_json:
+        local_embedding_config_json = embedding_config_json["local"]
+
+        model = local_embedding_config_json.get("model")
+        if not model:
+            raise ValueError("local embedding config must contain model")
+        
+        # Imported on demand as the local model dependencies are optional
+        from .local import LocalEmbeddingClient
+
+        return LocalEmbeddingClient(
+            model=model, 
+            device=local_embedding_config_json.get("device", "cpu"), 
+            batch_size=local_embedding_config_json.get("batch_size", 32)
+        )
+    else:
+        raise ValueError(f"embedding config contained unsupported provider: {embedding_config_json}")
@@ -1,8 +1,14 @@
+import numpy as np
 from typing import List, Protocol
 
 class EmbeddingClient(Protocol):
     """Protocol for embedding providers."""
 
+    @property
+    def model(self) -> str:
+        """str: The name of the model producing the embedding vectors."""
+        ...
+
     @property
     def dimensions(self) -> int:
         """int: The number of floating-point values in each embedding vector."""
@@ -17,4 +23,15 @@ class EmbeddingClient(Protocol):
         Returns:
             List[float]: The numeric embedding representation of the input text.
         """
-        ...
\ No newline at end of file
+        ...
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Compute embedding vectors for several texts at once.
+
+        Args:
+            texts (List[str]): The texts to encode into embedding vectors.
+
+        Returns:
+            np.ndarray: A float32 array of shape (len(texts), dimensions), one row per text.
+        """
+        ...
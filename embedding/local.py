@@ -0,0 +1,80 @@
+from concurrent.futures import Future
+import numpy as np
+import queue
+from sentence_transformers import SentenceTransformer
+import threading
+from typing import List, Tuple
+
+from .client import EmbeddingClient
+
+class LocalEmbeddingClient(EmbeddingClient):
+    """In-process embedding provider running a sentence-transformers model on the CPU.
+
+    The model is loaded once and only ever run by a dedicated inference thread, so
+    forward passes never compete for the CPU. `embed` and `embed_batch` calls are queued
+    to it, and calls arriving concurrently (e.g. from several chats) are coalesced into
+    one batched forward pass.
+    """
+
+    def __init__(self, model: str, device: str = "cpu", batch_size: int = 32):
+        self._model = SentenceTransformer(model, device=device)
+        self._model_name = model
+        self._batch_size = batch_size
+
+        dimensions = self._model.get_sentence_embedding_dimension()
+        if dimensions is None:
+            raise ValueError(f"local embedding model has no fixed dimensions: {model}")
+        self._dimensions = dimensions
+
+        self._requests: queue.Queue[Tuple[List[str], Future]] = queue.Queue()
+        threading.Thread(target=self._run_inference, name="local-embedding", daemon=True).start()
+
+    @property
+    def model(self) -> str:
+        return self._model_name
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        future: Future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = self._model.encode(
+            texts,
+            batch_size=self._batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+    def _run_inference(self):
+        while True:
+            requests = [self._requests.get()]
+            count = len(requests[0][0])
+
+            # Batch up requests that arrived while the previous batch was running
+            while count < self._batch_size:
+                try:
+                    requests.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+                count += len(requests[-1][0])
+
+            try:
+                embeddings = self._encode([text for texts, _ in requests for text in texts])
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for texts, future in requests:
+                future.set_result(embeddings[start:start + len(texts)])
+                start += len(texts)
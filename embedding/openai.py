@@ -1,3 +1,4 @@
+import numpy as np
 from openai import OpenAI
 from typing import List
 
@@ -9,10 +10,18 @@ class OpenAIEmbeddingClient(EmbeddingClient):
         self._model = model
         self._dimensions = dimensions
 
+    @property
+    def model(self) -> str:
+        return self._model
+
     @property
     def dimensions(self) -> int:
         return self._dimensions
 
     def embed(self, text: str) -> List[float]:
         embeddings = self._client.embeddings.create(model=self._model, input=text, dimensions=self._dimensions)
-        return embeddings.data[0].embedding
\ No newline at end of file
+        return embeddings.data[0].embedding
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        embeddings = self._client.embeddings.create(model=self._model, input=texts, dimensions=self._dimensions)
+        return np.array([embedding.embedding for embedding in embeddings.data], dtype=np.float32)
\ No newline at end of file
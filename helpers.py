@@ -1,29 +1,232 @@
 import os
 import re
+from typing import FrozenSet, List
 
-def sanitize_markdown(text: str) -> str:
-    """Sanitize Markdown for Telegram messages.
+# Characters Telegram's MarkdownV2 parser reserves, escaped everywhere outside of entities
+SPECIAL_CHARACTERS_PATTERN = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
 
-    Telegram's Markdown parser supports only a limited subset of syntax.
-    This function converts certain Markdown syntax to what Telegram supports.
+# Only ` and \ have to be escaped inside code and pre entities
+CODE_SPECIAL_CHARACTERS_PATTERN = re.compile(r'([`\\])')
 
-      • Converts double asterisk bold (`**bold**`) to single-asterisk bold (`*bold*`).
-      • Converts Markdown headers (`# Heading`) into bold text.
+# Only ) and \ have to be escaped inside the URL of a link
+URL_SPECIAL_CHARACTERS_PATTERN = re.compile(r'([)\\])')
+
+INLINE_TOKEN_PATTERNS = [
+    r'(?P<code>`(?P<code_body>[^`\n]+)`)',
+    r'(?P<link>\[(?P<link_text>[^\[\]\n]+)\]\((?P<link_url>(?:[^()\s]|\([^()\s]*\))+)\))',
+    r'(?P<bold>\*\*(?P<bold_body>[^\s*](?:(?:[^*\n]|\*(?!\*))*?[^\s*])?)\*\*)',
+    r'(?P<bold_underscore>(?<!\w)__(?P<bold_underscore_body>[^\s_](?:(?:[^_\n]|_(?!_))*?[^\s_])?)__(?!\w))',
+    r'(?P<strikethrough>~~(?P<strikethrough_body>[^\s~](?:(?:[^~\n]|~(?!~))*?[^\s~])?)~~)',
+    r'(?P<italic>(?<![\w*])\*(?P<italic_body>[^\s*](?:[^*\n]*[^\s*])?)\*(?![\w*]))',
+    r'(?P<italic_underscore>(?<!\w)_(?P<italic_underscore_body>[^\s_](?:[^_\n]*[^\s_])?)_(?!\w))',
+]
+
+# Block tokens can't be part of other entities
+BLOCK_TOKEN_PATTERNS = [
+    r'(?P<pre>```(?P<pre_language>[\w+#-]*)\n?(?P<pre_body>.*?)```)',
+    r'(?P<header>^[ \t]*#{1,6}[ \t]+(?P<header_body>[^\n]*?)[ \t]*#*[ \t]*$)',
+    r'(?P<quote>^>[ \t]?)',
+    r'(?P<bullet>^(?P<bullet_indent>[ \t]*)[*+-][ \t]+)',
+]
+
+TOKEN_PATTERN = re.compile('|'.join(BLOCK_TOKEN_PATTERNS + INLINE_TOKEN_PATTERNS), re.MULTILINE | re.DOTALL)
+INLINE_TOKEN_PATTERN = re.compile('|'.join(INLINE_TOKEN_PATTERNS), re.DOTALL)
+
+# Code blocks starting a line are kept whole when splitting long messages
+FENCE_PATTERN = re.compile(
+    r'^(?P<fence_header>```[\w+#-]*)[ \t]*\n(?P<fence_body>(?:(?!```).)*?)\n?```[ \t]*$', 
+    re.MULTILINE | re.DOTALL
+)
+PARAGRAPH_SEPARATOR_PATTERN = re.compile(r'\n[ \t]*\n')
+
+# Maximum length of a message's text, in UTF-16 code units
+MESSAGE_LENGTH_LIMIT = 4096
+
+# Markdown token and the Telegram entity it becomes
+ENTITY_MARKERS = {
+    'bold': ('bold', '*'),
+    'bold_underscore': ('bold', '*'),
+    'header': ('bold', '*'),
+    'italic': ('italic', '_'),
+    'italic_underscore': ('italic', '_'),
+    'strikethrough': ('strikethrough', '~'),
+}
+
+def to_markdown_v2(text: str) -> str:
+    """Convert Markdown written by an LLM into Telegram MarkdownV2.
+
+    The text is tokenized in a single pass with one precompiled pattern. Markdown that
+    Telegram supports is converted into the matching entity, anything else (including
+    unmatched markers) is escaped, so the result is always accepted by Telegram's parser.
+
+      • Converts bold (`**bold**`, `__bold__`), italic (`*italic*`, `_italic_`) and strikethrough (`~~strike~~`).
+      • Converts Markdown headers (`# Heading`) into bold text and bullets (`- item`) into `•`.
+      • Keeps inline code, code blocks, links and block quotes.
+
+    Args:
+        text: The Markdown string to convert.
+
+    Returns:
+        str: A MarkdownV2 string to send with `parse_mode='MarkdownV2'`.
+    """
+    return _convert(text=text, pattern=TOKEN_PATTERN, entities=frozenset())
+
+def escape_markdown_v2(text: str) -> str:
+    """Escape every character MarkdownV2 reserves, so the text is shown as is."""
+    return SPECIAL_CHARACTERS_PATTERN.sub(r'\\\1', text)
+
+def _convert(text: str, pattern: re.Pattern, entities: FrozenSet[str]) -> str:
+    parts = []
+    position = 0
+    for match in pattern.finditer(text):
+        parts.append(escape_markdown_v2(text[position:match.start()]))
+        parts.append(_convert_token(match=match, entities=entities))
+        position = match.end()
+    parts.append(escape_markdown_v2(text[position:]))
+    return ''.join(parts)
+
+def _convert_token(match: re.Match, entities: FrozenSet[str]) -> str:
+    token = match.lastgroup
+    if token == 'pre':
+        language, body = match.group('pre_language'), match.group('pre_body')
+        return f"```{language}\n{_escape_code(body)}```"
+
+    if token == 'code':
+        return f"`{_escape_code(match.group('code_body'))}`"
+
+    if token == 'link':
+        link_text = _convert(text=match.group('link_text'), pattern=INLINE_TOKEN_PATTERN, entities=entities)
+        return f"[{link_text}]({_escape_url(match.group('link_url'))})"
+
+    if token == 'quote':
+        return '>'
+
+    if token == 'bullet':
+        return f"{match.group('bullet_indent')}• "
+
+    entity, marker = ENTITY_MARKERS[token]
+    body = _convert(
+        text=match.group(f'{token}_body'),
+        pattern=INLINE_TOKEN_PATTERN,
+        entities=entities | {entity}
+    )
+
+    # Telegram can't nest an entity in itself, the inner one is dropped
+    if entity in entities:
+        return body
+
+    return f"{marker}{body}{marker}"
+
+def _escape_code(text: str) -> str:
+    return CODE_SPECIAL_CHARACTERS_PATTERN.sub(r'\\\1', text)
+
+def _escape_url(text: str) -> str:
+    return URL_SPECIAL_CHARACTERS_PATTERN.sub(r'\\\1', text)
+
+def split_markdown(text: str, limit: int = MESSAGE_LENGTH_LIMIT) -> List[str]:
+    """Split Markdown into chunks that each fit in one Telegram message once converted.
+
+    Text is split at paragraphs first, then lines, then words, and only cut mid-word as a
+    last resort. Code blocks are kept whole where possible, otherwise split by lines into
+    several code blocks. As every chunk is converted on its own by `to_markdown_v2`, a
+    marker cut off by a split is escaped rather than breaking the message.
 
     Args:
-        text: The Markdown string to normalize.
+        text: The Markdown string to split.
+        limit: Maximum length of a converted chunk, in UTF-16 code units like Telegram counts.
 
     Returns:
-        str: A sanitized Markdown string safe for Telegram.
+        List[str]: Markdown chunks, in order.
     """
+    blocks = []
+    position = 0
+    for match in FENCE_PATTERN.finditer(text):
+        blocks.extend(PARAGRAPH_SEPARATOR_PATTERN.split(text[position:match.start()]))
+        blocks.append(match.group())
+        position = match.end()
+    blocks.extend(PARAGRAPH_SEPARATOR_PATTERN.split(text[position:]))
+
+    return _pack(parts=[block.strip('\n') for block in blocks if block.strip()], separator='\n\n', limit=limit)
+
+def _pack(parts: List[str], separator: str, limit: int) -> List[str]:
+    chunks: List[str] = []
+    current: List[str] = []
+    current_length = 0
+
+    def flush():
+        if current:
+            chunks.extend(_verified(parts=list(current), separator=separator, limit=limit))
+            current.clear()
+
+    for part in parts:
+        part_length = _converted_length(part)
+        if part_length > limit:
+            flush()
+            current_length = 0
+            chunks.extend(_split_part(part=part, limit=limit))
+            continue
+
+        if current and current_length + len(separator) + part_length > limit:
+            flush()
+            current_length = 0
+
+        current_length += part_length + (len(separator) if current else 0)
+        current.append(part)
+
+    flush()
+    return chunks
+
+def _verified(parts: List[str], separator: str, limit: int) -> List[str]:
+    # Lengths of parts are converted one by one, joined they can convert slightly differently
+    chunk = separator.join(parts)
+    if len(parts) == 1 or _converted_length(chunk) <= limit:
+        return [chunk]
+
+    middle = len(parts) // 2
+    return (
+        _verified(parts=parts[:middle], separator=separator, limit=limit) 
+        + _verified(parts=parts[middle:], separator=separator, limit=limit)
+    )
+
+def _split_part(part: str, limit: int) -> List[str]:
+    fence = FENCE_PATTERN.fullmatch(part)
+    if fence:
+        return _split_code_block(header=fence.group('fence_header'), body=fence.group('fence_body'), limit=limit)
+
+    for separator in ('\n', ' '):
+        if separator in part:
+            return _pack(parts=part.split(separator), separator=separator, limit=limit)
+
+    # Escaping at most doubles the length of a character
+    size = limit // 2
+    return [part[index:index + size] for index in range(0, len(part), size)]
+
+def _split_code_block(header: str, body: str, limit: int) -> List[str]:
+    # Room for the header, its newline and the closing fence
+    body_limit = limit - utf16_length(header) - 4
+    size = body_limit // 2
+
+    lines: List[str] = []
+    for line in body.split('\n'):
+        lines.extend(line[index:index + size] for index in range(0, max(len(line), 1), size))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_length = 0
+    for line in lines:
+        line_length = utf16_length(_escape_code(line)) + 1
+        if current and current_length + line_length > body_limit:
+            chunks.append(f"{header}\n" + '\n'.join(current) + "\n```")
+            current, current_length = [], 0
+        current.append(line)
+        current_length += line_length
+
+    if current:
+        chunks.append(f"{header}\n" + '\n'.join(current) + "\n```")
+    return chunks
 
-    # Convert double asterisk bold to single asterisk bold.  
-    text = text.replace('**', '*')
-    
-    # Replace all headers in the text with bold.
-    pattern = re.compile(r'^(#+)\s*(.*)', re.MULTILINE)    
-    def replace_header_with_bold(match):
-        return f"*{match.group(2)}*"
-    text = re.sub(pattern, replace_header_with_bold, text)
+def _converted_length(text: str) -> int:
+    return utf16_length(to_markdown_v2(text))
 
-    return text
\ No newline at end of file
+def utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
@@ -1,36 +1,52 @@
 from telegram.constants import ReactionEmoji
-from typing import List, Optional, Protocol
+from typing import Dict, List, NamedTuple, Optional, Protocol
 
 from database import Message
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
+from pydantic.json_schema import SkipJsonSchema
+
+def _build_reaction_lookup() -> Dict[str, ReactionEmoji]:
+    lookup: Dict[str, ReactionEmoji] = {}
+    for emoji in ReactionEmoji:
+        # Some models return the UTF-8 bytes of an emoji decoded as latin-1
+        try:
+            lookup[emoji.value.encode('utf-8').decode('latin-1')] = emoji
+        except UnicodeDecodeError:
+            pass
+    
+    # Exact values take precedence over mis-decoded ones
+    lookup.update({emoji.value: emoji for emoji in ReactionEmoji})
+    return lookup
+
+REACTION_LOOKUP = _build_reaction_lookup()
+
+class Usage(NamedTuple):
+    input_tokens: int
+    output_tokens: int
 
 class Response(BaseModel):
     message: str
     reaction: Optional[ReactionEmoji] = None
     reaction_strength: float
 
+    # Set by the client, left out of the structured output schema
+    usage: SkipJsonSchema[Optional[Usage]] = Field(default=None, exclude=True)
+
     @field_validator('reaction', mode='before')
     @classmethod
     def normalize_reaction(cls, value):
-        if value in (None, ""):
-            return None
-
         if isinstance(value, ReactionEmoji):
             return value
 
         if isinstance(value, str):
-            if value in ReactionEmoji._value2member_map_:
-                return ReactionEmoji(value)
-
-            try:
-                decoded = value.encode('latin-1').decode('utf-8')
-            except (UnicodeDecodeError, UnicodeEncodeError):
-                return None
-
-            if decoded in ReactionEmoji._value2member_map_:
-                return ReactionEmoji(decoded)
+            return REACTION_LOOKUP.get(value)
 
         return None
 
+class SummaryResponse(NamedTuple):
+    text: str
+    usage: Optional[Usage] = None
+
 class LLMClient(Protocol):
-    def generate_response(self, prompt: str, messages: List[Message]) -> Response: ...
\ No newline at end of file
+    def generate_response(self, prompt: str, messages: List[Message]) -> Response: ...
+    def summarize(self, prompt: str, messages: List[Message]) -> SummaryResponse: ...
\ No newline at end of file
@@ -1,9 +1,10 @@
 import json
 from openai import OpenAI
 from openai.types.responses import EasyInputMessageParam, ResponseInputParam
+from openai.types.responses import Response as OpenAIResponse
 from typing import Any, cast, Dict, List
 
-from .client import LLMClient, Response
+from .client import LLMClient, Response, SummaryResponse, Usage
 from database import Message
 
 class OpenAILLMClient(LLMClient):
@@ -13,6 +14,50 @@ class OpenAILLMClient(LLMClient):
         self.openai = OpenAI(api_key=api_key)
 
     def generate_response(self, prompt: str, messages: List[Message]) -> Response:
+        # Make OpenAI request, the SDK derives the strict JSON schema from Response and parses the output
+        openai_response = self.openai.responses.parse(
+            model=self.model,
+            input=self._build_input(prompt=prompt, messages=messages),
+            text_format=Response,
+            timeout=30
+        )
+
+        response = openai_response.output_parsed
+        if response is None:
+            refusal = next(
+                (
+                    content.refusal
+                    for output in openai_response.output if output.type == 'message'
+                    for content in output.content if content.type == 'refusal'
+                ),
+                None
+            )
+            if refusal:
+                raise RuntimeError(f'Request refused: {refusal}')
+            raise RuntimeError('Received empty output_text')
+
+        response.usage = self._usage(openai_response)
+        return response
+    
+    def summarize(self, prompt: str, messages: List[Message]) -> SummaryResponse:
+        openai_response = self.openai.responses.create(
+            model=self.model,
+            input=self._build_input(prompt=prompt, messages=messages),
+            timeout=60
+        )
+
+        if not openai_response.output_text:
+            raise RuntimeError('Received empty output_text')
+        
+        return SummaryResponse(
+            text=openai_response.output_text,
+            usage=self._usage(openai_response)
+        )
+    
+    # Helpers
+    # -----------------------------------------
+
+    def _build_input(self, prompt: str, messages: List[Message]) -> ResponseInputParam:
         # Format messages for OpenAI request
         messages_json: list[EasyInputMessageParam] = []
         for message in messages:
@@ -26,21 +71,16 @@ class OpenAILLMClient(LLMClient):
         # Add prompt as the first message
         messages_json.insert(0, {"role": "developer", "content": prompt})
 
-        # Make OpenAI request
-        response = self.openai.responses.parse(
-            model=self.model,
-            input=cast(ResponseInputParam, messages_json),
-            text_format=Response,
-            timeout=30
-        ).output_parsed
+        return cast(ResponseInputParam, messages_json)
 
-        if response is None:
-            raise RuntimeError('Received empty output_parsed')
-        
-        return response
-    
-    # Helpers
-    # -----------------------------------------
+    def _usage(self, openai_response: OpenAIResponse) -> Usage | None:
+        if not openai_response.usage:
+            return None
+
+        return Usage(
+            input_tokens=openai_response.usage.input_tokens, 
+            output_tokens=openai_response.usage.output_tokens
+        )
 
     def _build_metadata_string(self, message: Message) -> str:
         metadata: Dict[str, Any] = {
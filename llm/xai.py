@@ -1,11 +1,18 @@
 import json
 from typing import Any, cast, Dict, List
 from xai_sdk import Client
-from xai_sdk.chat import assistant, system, user
+from xai_sdk.chat import assistant, Response as XAIResponse, system, user
+from xai_sdk.proto import chat_pb2
 
-from .client import LLMClient, Response
+from .client import LLMClient, Response, SummaryResponse, Usage
 from database import Message
 
+# JSON schema of Response, built once instead of on every request
+RESPONSE_FORMAT = chat_pb2.ResponseFormat(
+    format_type=chat_pb2.FormatType.FORMAT_TYPE_JSON_SCHEMA,
+    schema=json.dumps(Response.model_json_schema())
+)
+
 class XAILLMClient(LLMClient):
     def __init__(self, api_key: str, model: str, bot_id: int):
         self.model = model
@@ -13,7 +20,32 @@ class XAILLMClient(LLMClient):
         self.xai = Client(api_key=api_key)
 
     def generate_response(self, prompt: str, messages: List[Message]) -> Response:
-        chat = self.xai.chat.create(model=self.model)
+        chat = self._build_chat(prompt=prompt, messages=messages, response_format=RESPONSE_FORMAT)
+
+        # Make xAI request
+        xai_response = chat.sample()
+        if not xai_response.content:
+            raise RuntimeError('Received empty content')
+        
+        # Parsed straight from the raw JSON by pydantic-core
+        response = Response.model_validate_json(xai_response.content)
+        response.usage = self._usage(xai_response)
+        return response
+    
+    def summarize(self, prompt: str, messages: List[Message]) -> SummaryResponse:
+        chat = self._build_chat(prompt=prompt, messages=messages)
+
+        xai_response = chat.sample()
+        if not xai_response.content:
+            raise RuntimeError('Received empty content')
+        
+        return SummaryResponse(text=xai_response.content, usage=self._usage(xai_response))
+    
+    # Helpers
+    # -----------------------------------------
+
+    def _build_chat(self, prompt: str, messages: List[Message], response_format: chat_pb2.ResponseFormat | None = None):
+        chat = self.xai.chat.create(model=self.model, response_format=response_format)
         chat.append(system(prompt))
         for message in messages:
             chat.append(system(self._build_metadata_string(message)))
@@ -21,15 +53,13 @@ class XAILLMClient(LLMClient):
                 chat.append(assistant(message.text))
             else:
                 chat.append(user(message.text))
+        return chat
 
-        # Make xAI request
-        xai_response, response = chat.parse(Response)
-        assert isinstance(response, Response)
-        
-        return response
-    
-    # Helpers
-    # -----------------------------------------
+    def _usage(self, xai_response: XAIResponse) -> Usage:
+        return Usage(
+            input_tokens=xai_response.usage.prompt_tokens, 
+            output_tokens=xai_response.usage.completion_tokens
+        )
 
     def _build_metadata_string(self, message: Message) -> str:
         metadata: Dict[str, Any] = {
@@ -1,30 +1,107 @@
+import atexit
+import copy
+from contextvars import ContextVar
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
 from pathlib import Path
+import queue
 
 logger = logging.getLogger("telegram_ai_bot")
 log_formatter = logging.Formatter('%(asctime)s - %(filename)s - %(funcName)s:%(lineno)d - %(levelname)s - %(message)s')
 
-def configure_logger(path: Path):
+# Records waiting for the background writer, further records are dropped
+LOG_QUEUE_SIZE = 10_000
+
+# Bot handling the current update, copied into threads started with asyncio.to_thread
+current_bot: ContextVar[str] = ContextVar("current_bot", default="")
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full.
+
+    Records are tagged with the current bot and queued unformatted, the listener thread
+    interpolates their arguments and formats tracebacks.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so args and exc_info can be handed over as is
+        record = copy.copy(record)
+        record.bot = current_bot.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class BotFilter(logging.Filter):
+    """Passes the records of one bot, and records not logged on behalf of any bot."""
+
+    def __init__(self, bot: str):
+        super().__init__()
+        self.bot = bot
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, "bot", "") in ("", self.bot)
+
+_log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_queue_handler = DroppingQueueHandler(_log_queue)
+_listener: QueueListener | None = None
+
+def configure_logger(path: Path) -> logging.Handler:
+    """Log to the console and to a rotating file at `path`.
+
+    Records are only put on a queue by the logging thread, a background listener thread
+    formats them and writes them to the handlers, so slow disks or consoles never block
+    the event loop. Calling it again for another bot adds another file, the console is
+    shared by all bots in a process. The file handler is returned so a `BotFilter` can
+    be attached once the bot is known.
+    """
+    global _listener
     logger.setLevel(logging.DEBUG)
 
-    # Determine console log level from env var
-    console_level_str = os.getenv("LOG_CONSOLE_LEVEL", "INFO").upper()
-    console_level = getattr(logging, console_level_str, logging.INFO)
+    if _listener is None:
+        # Determine console log level from env var
+        console_level_str = os.getenv("LOG_CONSOLE_LEVEL", "INFO").upper()
+        console_level = getattr(logging, console_level_str, logging.INFO)
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(log_formatter)
+
+        _listener = QueueListener(_log_queue, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
 
-    # Create console handler with an ERROR level
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(console_level)
+        logger.addHandler(_queue_handler)
 
     # Create file handler for all logs
     file_handler = RotatingFileHandler(path, maxBytes=5_000_000)
     file_handler.setLevel(logging.DEBUG)
-
-    # Set log formatters
-    console_handler.setFormatter(log_formatter)
     file_handler.setFormatter(log_formatter)
+    add_log_handler(file_handler)
+    return file_handler
+
+def add_log_handler(handler: logging.Handler):
+    """Add a handler that is run on the background listener thread."""
+    if _listener is None:
+        raise RuntimeError("configure_logger must be called first")
+
+    # The listener reads its handlers on every record, replacing the tuple is thread-safe
+    _listener.handlers = _listener.handlers + (handler,)
+
+def remove_log_handler(handler: logging.Handler):
+    """Remove a handler added with `add_log_handler`, records already being handled may still reach it."""
+    if _listener is not None:
+        _listener.handlers = tuple(
+            listener_handler for listener_handler in _listener.handlers if listener_handler is not handler
+        )
 
-    # Add the handlers to the logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+def dropped_log_records() -> int:
+    """Records dropped since the process started, because the queue was full."""
+    return _queue_handler.dropped
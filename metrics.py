@@ -0,0 +1,196 @@
+from aiohttp import web
+import bisect
+from contextlib import contextmanager
+from opentelemetry import trace
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+from logger import current_bot, dropped_log_records, logger
+
+# Upper bounds in seconds, covering fast DB reads up to slow LLM requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+tracer = trace.get_tracer("telegram_ai_bot")
+_tracing_configured = False
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class FunctionCounter:
+    """Counter without labels whose value is read from `read` when rendered."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter", f"{self.name} {self.read()}"]
+
+class Histogram:
+    """Histogram with fixed buckets and labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+
+        # Per label values: count per bucket (last one is +Inf), sum of observations
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(self.labels + ("le",), key + (_format_bound(bound),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total[0]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class Pricing(NamedTuple):
+    """LLM prices in USD per million tokens."""
+    input: float
+    output: float
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input + output_tokens * self.output) / 1_000_000
+
+STAGE_SECONDS = Histogram(
+    "telegram_bot_stage_seconds",
+    "Time spent in each stage of handling an update.",
+    labels=("bot", "stage")
+)
+LLM_TOKENS = Counter(
+    "telegram_bot_llm_tokens_total",
+    "LLM tokens used, by direction (input or output).",
+    labels=("bot", "chat_id", "direction")
+)
+LLM_COST = Counter(
+    "telegram_bot_llm_cost_usd_total",
+    "LLM cost in USD, from the configured pricing.",
+    labels=("bot", "chat_id")
+)
+LOG_RECORDS_DROPPED = FunctionCounter(
+    "telegram_bot_log_records_dropped_total",
+    "Log records dropped because the background log writer fell behind.",
+    read=dropped_log_records
+)
+
+METRICS = [STAGE_SECONDS, LLM_TOKENS, LLM_COST, LOG_RECORDS_DROPPED]
+
+@contextmanager
+def timed(stage: str, **attributes) -> Iterator[None]:
+    """Observe the duration of the block as `stage` of the current bot, within a span."""
+    bot = current_bot.get()
+    started_at = time.perf_counter()
+    with tracer.start_as_current_span(stage, attributes={"bot": bot, **attributes}):
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started_at, bot=bot, stage=stage)
+
+def record_llm_usage(chat_id: int, input_tokens: int, output_tokens: int, pricing: Pricing | None):
+    bot = current_bot.get()
+    LLM_TOKENS.inc(input_tokens, bot=bot, chat_id=chat_id, direction="input")
+    LLM_TOKENS.inc(output_tokens, bot=bot, chat_id=chat_id, direction="output")
+    if pricing is not None:
+        LLM_COST.inc(pricing.cost(input_tokens=input_tokens, output_tokens=output_tokens), bot=bot, chat_id=chat_id)
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+def configure_tracing(path: Path):
+    """Export OpenTelemetry spans as JSON lines to the file at `path`, once per process."""
+    global _tracing_configured
+    if _tracing_configured:
+        return
+    _tracing_configured = True
+
+    # Without a configured provider spans are no-ops, the SDK is only needed here
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    spans_file = open(path, "a")
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+        out=spans_file,
+        formatter=lambda span: span.to_json(indent=None) + "\n"
+    )))
+    trace.set_tracer_provider(provider)
+
+class MetricsServer:
+    """Local HTTP server exposing all metrics of the process at `/metrics`."""
+
+    def __init__(self):
+        self._app = web.Application()
+        self._app.router.add_get("/metrics", self._on_request)
+        self._runner: web.AppRunner | None = None
+        self._addresses: set[tuple[str, int]] = set()
+
+    @property
+    def has_addresses(self) -> bool:
+        return len(self._addresses) > 0
+
+    def add_address(self, listen: str, port: int):
+        # Bots of a process share their metrics, so the same address is only served once
+        self._addresses.add((listen, port))
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+        for listen, port in self._addresses:
+            await web.TCPSite(self._runner, host=listen, port=port).start()
+            logger.info(f"Metrics server listening: {listen}:{port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _on_request(self, request: web.Request) -> web.Response:
+        return web.Response(body=render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
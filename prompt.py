@@ -2,7 +2,7 @@ import json
 from telegram.constants import ReactionEmoji
 from typing import List
 
-from database import User
+from database import Summary, User
 
 PROMPT_TEMPLATE = """
 **Your name is {name}.**  
@@ -22,7 +22,32 @@ Response Model:
 - reaction_strength: A float between 0 and 1 indicating how strongly you react to the last message.
 """
 
-def generate_prompt(members: List[User], bot_name: str, bot_identity: str) -> str:
+# Listed once, the emoji set doesn't change at runtime
+REACTION_OPTIONS = ', '.join(emoji.value for emoji in ReactionEmoji)
+
+SUMMARY_TEMPLATE = """
+Summary of the earlier conversation, older messages are not included below:
+
+{summary}
+"""
+
+SUMMARY_PROMPT_TEMPLATE = """
+**Your name is {name}.**
+
+Summarize the conversation so the summary can replace the messages in your memory of it.
+Only your newest summary is kept, so carry over what still matters from the previous summary and add the following chat messages.
+Keep who said what, decisions, open questions, facts members shared about themselves and the overall tone.
+Refer to members by name. Write plain text of at most {max_words} words, without preamble.
+
+{previous_summary}
+"""
+
+def generate_prompt(
+    members: List[User], 
+    bot_name: str, 
+    bot_identity: str, 
+    summary: Summary | None = None
+) -> str:
     members_json = [
         {
             "id": member.id,
@@ -34,9 +59,22 @@ def generate_prompt(members: List[User], bot_name: str, bot_identity: str) -> st
     ]
 
     # Use format() to replace placeholders
-    return PROMPT_TEMPLATE.format(
+    prompt = PROMPT_TEMPLATE.format(
         name=bot_name,
         bot_identity=bot_identity,
         members=json.dumps(members_json, indent=4),
-        reaction_options=', '.join(emoji.value for emoji in ReactionEmoji)
+        reaction_options=REACTION_OPTIONS
+    )
+
+    if summary:
+        prompt += SUMMARY_TEMPLATE.format(summary=summary.text)
+
+    return prompt
+
+def generate_summary_prompt(bot_name: str, previous_summary: str | None, max_words: int = 300) -> str:
+    return SUMMARY_PROMPT_TEMPLATE.format(
+        name=bot_name,
+        max_words=max_words,
+        previous_summary=f"Previous summary of the conversation before these messages:\n\n{previous_summary}" 
+            if previous_summary else ""
     )
\ No newline at end of file
@@ -1,56 +1,815 @@
+import asyncio
+from contextlib import nullcontext
 from datetime import datetime, timedelta, timezone
+import json
 import lancedb
+import numpy as np
+import os
 from pathlib import Path
 import pyarrow as pa
-from typing import List, Set
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Set, Tuple
 
+from database import Database
 from embedding.client import EmbeddingClient
 from logger import logger
+from metrics import timed
+from workers import interprocess_lock, STORAGE_LOCK_FILE
 
 TABLE_NAME = "embeddings"
 
+# Points to the embeddings table in use, replaced atomically when history is re-embedded
+ACTIVE_TABLE_FILE = "embeddings.json"
+
+VECTOR_MODE = "vector"
+HYBRID_MODE = "hybrid"
+
+UPDATE_INTERVAL_SECONDS = 5
+
+# Messages embedded per batch when catching up with messages missed by a reindex
+CATCH_UP_BATCH_SIZE = 256
+
+# Candidates retrieved per result when re-ranking by recency
+RERANK_CANDIDATES = 3
+
+LANCEDB_ENGINE = "lancedb"
+MATRIX_ENGINE = "matrix"
+
+MATRICES_FOLDER = "matrices"
+EMBEDDINGS_FILE = "embeddings.f32"
+NORMS_FILE = "norms.f32"
+TIMESTAMPS_FILE = "timestamps.f64"
+IDS_FILE = "ids.i64"
+META_FILE = "meta.json"
+DELETED_ID = -1
+
+# Rows kept per chat matrix, older messages are searched in LanceDB
+MATRIX_MAX_ROWS = 100_000
+
+# Rows appended beyond the cap before a matrix is trimmed, so trimming is amortized
+MATRIX_TRIM_SLACK = 0.25
+
+# Dampens the weight of top ranks in reciprocal rank fusion, 60 is the value from the original paper
+RRF_K = 60
+
+class SearchResults(NamedTuple):
+    ids: np.ndarray
+    """np.ndarray: Message ids, best match first."""
+    distances: np.ndarray
+    """np.ndarray: Squared L2 distance of each message, NaN for full text and thread matches."""
+    created_at: np.ndarray
+    """np.ndarray: UTC timestamp of each message, NaN for full text and thread matches."""
+
+    def take(self, indices: np.ndarray) -> "SearchResults":
+        return SearchResults(
+            ids=self.ids[indices], 
+            distances=self.distances[indices], 
+            created_at=self.created_at[indices]
+        )
+
+EMPTY_SEARCH_RESULTS = SearchResults(
+    ids=np.empty(0, dtype=np.int64), 
+    distances=np.empty(0, dtype=np.float32), 
+    created_at=np.empty(0, dtype=np.float64)
+)
+
 class Rag:
     def __init__(
         self, 
         path: Path, 
         embedding_client: EmbeddingClient,  
-        limit: int
+        limit: int,
+        database: Database,
+        mode: str = VECTOR_MODE,
+        embedding_timeout: float | None = None,
+        engine: str = LANCEDB_ENGINE,
+        max_distance: float | None = None,
+        recency_half_life: timedelta | None = None,
+        thread_depth: int | None = None,
+        matrix_max_rows: int = MATRIX_MAX_ROWS
     ):
         self._embedding_client = embedding_client
         self._limit = limit
+        self._message_database = database
+        self.mode = mode
+        self.embedding_timeout = embedding_timeout
+        self._max_distance = max_distance
+        self._recency_half_life = recency_half_life
+        self._thread_depth = thread_depth
+
+        # Edits and deletes queued until the next batch is applied
+        self._pending_lock = threading.Lock()
+        self._pending_updates: Dict[Tuple[int, int], Tuple[datetime, str]] = {}
+        self._pending_deletes: Set[Tuple[int, int]] = set()
+
         self._database = lancedb.connect(path)
-        if TABLE_NAME not in self._database.table_names():
+
+        active_table = read_active_table(path)
+        if active_table is None:
+            # First start, or a store created before tables were versioned.
+            # Worker processes may race to create the table.
             self.table = self._database.create_table(
                 TABLE_NAME, 
-                schema=pa.schema([
-                    pa.field("id", pa.int64()),
-                    pa.field("chat_id", pa.int64()),
-                    pa.field("created_at", pa.float64()),
-                    pa.field("embedding", pa.list_(pa.float32(), embedding_client.dimensions)),
-                ])
+                exist_ok=True,
+                schema=embeddings_schema(dimensions=embedding_client.dimensions)
+            )
+
+            dimensions = self.table.schema.field("embedding").type.list_size
+            if dimensions != embedding_client.dimensions:
+                raise ValueError(
+                    f"embeddings table has {dimensions} dimensions but embedding config has "
+                    f"{embedding_client.dimensions}, re-embed history with reindex.py"
+                )
+            
+            write_active_table(
+                path=path, 
+                table_name=TABLE_NAME, 
+                model=embedding_client.model, 
+                dimensions=embedding_client.dimensions
             )
         else:
-            self.table = self._database.open_table(TABLE_NAME)
+            if (
+                active_table["model"] != embedding_client.model 
+                or active_table["dimensions"] != embedding_client.dimensions
+            ):
+                raise ValueError(
+                    f"embeddings table was built with {active_table['model']} ({active_table['dimensions']} dimensions) "
+                    f"but embedding config has {embedding_client.model} ({embedding_client.dimensions} dimensions), "
+                    "re-embed history with reindex.py"
+                )
+            
+            self.table = self._database.open_table(active_table["table"])
+
+            # Messages stored after a reindex finished were only embedded into the previous table
+            if active_table.get("after_rowid") is not None:
+                self._catch_up(path=path)
+
+        self._matrix_index: ChatMatrixIndex | None = None
+        matrices_path = path / MATRICES_FOLDER / self.table.name
+        if engine == MATRIX_ENGINE:
+            self._matrix_index = ChatMatrixIndex(
+                path=matrices_path,
+                dimensions=embedding_client.dimensions,
+                load_chat=self._load_chat,
+                count_chat=self._count_chat,
+                max_rows=matrix_max_rows
+            )
+        elif matrices_path.exists():
+            # Writes are no longer mirrored, so the matrices would be stale if the engine is switched back.
+            # Worker processes start at once, any of them may have removed them already.
+            shutil.rmtree(matrices_path, ignore_errors=True)
+            logger.info(f"rag_matrices_removed - table: {self.table.name}")
+
+    def _catch_up(self, path: Path):
+        # Worker processes start at once, the first one catches up and the others find it done
+        with interprocess_lock(path / STORAGE_LOCK_FILE):
+            active_table = read_active_table(path)
+            if active_table is None or active_table["table"] != self.table.name or active_table.get("after_rowid") is None:
+                return
+
+            after_rowid, count = active_table["after_rowid"], 0
+            try:
+                while rows := self._message_database.get_messages_after_rowid(after_rowid=after_rowid, limit=CATCH_UP_BATCH_SIZE):
+                    messages = [message for _, message in rows]
+                    upsert_embeddings(
+                        table=self.table,
+                        ids=[message.id for message in messages],
+                        chat_ids=[message.chat_id for message in messages],
+                        timestamps=[utc_timestamp(message.created_at) for message in messages],
+                        embeddings=self._embedding_client.embed_batch([message.text for message in messages])
+                    )
+                    after_rowid, count = rows[-1][0], count + len(rows)
+
+                    # Advanced after every batch, so a failed catch-up resumes where it stopped
+                    write_active_table(
+                        path=path, 
+                        table_name=self.table.name, 
+                        model=self._embedding_client.model, 
+                        dimensions=self._embedding_client.dimensions,
+                        after_rowid=after_rowid
+                    )
+            except Exception as e:
+                # Retried on the next start
+                logger.error(f"rag_catch_up_failed - table: {self.table.name} - after_rowid: {after_rowid} - error: {e}")
+                return
+
+            write_active_table(
+                path=path, 
+                table_name=self.table.name, 
+                model=self._embedding_client.model, 
+                dimensions=self._embedding_client.dimensions
+            )
+            logger.info(f"rag_caught_up - table: {self.table.name} - count: {count}")
 
     def embed(self, message_id: int, chat_id: int, created_at: datetime, text: str) -> List[float]:
-        embedding = self._embedding_client.embed(text)
-        self.table.add([{
-            "id": message_id, 
-            "chat_id": chat_id,
-            "created_at": created_at.astimezone(timezone.utc).timestamp(),
-            "embedding": embedding
-        }])
+        with timed("embed"):
+            embedding = self._embedding_client.embed(text)
+        timestamp = created_at.astimezone(timezone.utc).timestamp()
+
+        with self._matrix_index.lock(chat_id) if self._matrix_index else nullcontext():
+            self.table.add([{
+                "id": message_id, 
+                "chat_id": chat_id,
+                "created_at": timestamp,
+                "embedding": embedding
+            }])
+
+            if self._matrix_index:
+                self._matrix_index.append(
+                    chat_id=chat_id, 
+                    ids=np.array([message_id]), 
+                    timestamps=np.array([timestamp]), 
+                    embeddings=np.asarray(embedding)
+                )
+
         return embedding
 
+    def update(self, message_id: int, chat_id: int, created_at: datetime, text: str) -> None:
+        """Queue (re-)embedding a message, e.g. an edited one, applied with the next batch of updates.
+
+        Rows are upserted, so queueing a message whose embedding is stored after all is harmless.
+        """
+        with self._pending_lock:
+            self._pending_updates[(message_id, chat_id)] = (created_at, text)
+            self._pending_deletes.discard((message_id, chat_id))
+
     def delete(self, message_id: int, chat_id: int) -> None:
-        self.table.delete(f"id = {message_id} AND chat_id = {chat_id}")
+        """Queue deleting a message's embedding, applied with the next batch of updates."""
+        with self._pending_lock:
+            self._pending_deletes.add((message_id, chat_id))
+            self._pending_updates.pop((message_id, chat_id), None)
 
-    def search(self, chat_id: int, embedding: List[float], before: timedelta) -> Set[int]:
-        query = f"chat_id = {chat_id} AND created_at < {(datetime.now(timezone.utc) - before).timestamp()}"
-        messages = self.table.search(embedding).where(query).limit(self._limit).to_list()
+    async def run_updates(self, interval: float = UPDATE_INTERVAL_SECONDS):
+        """Periodically apply queued updates and deletes until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.apply_updates)
+            except Exception as e:
+                logger.error(f"rag_updates_failed - error: {e}")
 
-        message_ids: Set[int] = set()
-        for message in messages:
-            message_ids.add(int(message["id"]))
-            
-        return message_ids
\ No newline at end of file
+    def apply_updates(self) -> None:
+        """Apply queued updates and deletes in batches.
+
+        Edited messages are re-embedded in a single batch and upserted with one merge on
+        (id, chat_id), and deletes are combined into a single predicate, so edits don't
+        rewrite the table (or create a fragment) one message at a time.
+        """
+        with self._pending_lock:
+            updates, self._pending_updates = self._pending_updates, {}
+            deletes, self._pending_deletes = self._pending_deletes, set()
+
+        try:
+            self._apply_updates(updates=updates, deletes=deletes)
+        except Exception:
+            # Queue again unless superseded in the meantime, so the batch is retried
+            with self._pending_lock:
+                for key, update in updates.items():
+                    if key not in self._pending_deletes:
+                        self._pending_updates.setdefault(key, update)
+                for key in deletes:
+                    if key not in self._pending_updates:
+                        self._pending_deletes.add(key)
+            raise
+
+    def _apply_updates(self, updates: Dict[Tuple[int, int], Tuple[datetime, str]], deletes: Set[Tuple[int, int]]):
+        if updates:
+            keys = list(updates.keys())
+            embeddings = self._embedding_client.embed_batch([text for _, text in updates.values()])
+            rows = upsert_embeddings(
+                table=self.table,
+                ids=[message_id for message_id, _ in keys],
+                chat_ids=[chat_id for _, chat_id in keys],
+                timestamps=[created_at.astimezone(timezone.utc).timestamp() for created_at, _ in updates.values()],
+                embeddings=embeddings
+            )
+            logger.info(f"rag_updated - count: {len(updates)}")
+
+            if self._matrix_index:
+                chat_ids = rows["chat_id"].to_numpy()
+                for chat_id in np.unique(chat_ids):
+                    chat_rows = chat_ids == chat_id
+                    with self._matrix_index.lock(int(chat_id)):
+                        self._matrix_index.upsert(
+                            chat_id=int(chat_id),
+                            ids=rows["id"].to_numpy()[chat_rows],
+                            timestamps=rows["created_at"].to_numpy()[chat_rows],
+                            embeddings=embeddings[chat_rows]
+                        )
+
+        if deletes:
+            message_ids_by_chat: Dict[int, List[int]] = {}
+            for message_id, chat_id in deletes:
+                message_ids_by_chat.setdefault(chat_id, []).append(message_id)
+
+            self.table.delete(" OR ".join(
+                f"(chat_id = {chat_id} AND id IN ({', '.join(str(message_id) for message_id in message_ids)}))"
+                for chat_id, message_ids in message_ids_by_chat.items()
+            ))
+            logger.info(f"rag_deleted - count: {len(deletes)}")
+
+            if self._matrix_index:
+                for chat_id, message_ids in message_ids_by_chat.items():
+                    with self._matrix_index.lock(chat_id):
+                        self._matrix_index.delete(chat_id=chat_id, ids=np.array(message_ids))
+
+    def search(
+        self, 
+        chat_id: int, 
+        embedding: List[float] | None, 
+        before: timedelta, 
+        text: str | None = None,
+        message_id: int | None = None
+    ) -> SearchResults:
+        """Find messages relevant to a message, among messages older than `before`.
+
+        Vector matches further than the configured `max_distance` are dropped, so fewer
+        than `limit` results are returned when there are no close matches. With a
+        `recency_half_life`, more candidates are retrieved and re-ranked so that their
+        relevance halves with every half-life of age.
+
+        In hybrid mode the vector and full text search rankings are merged with reciprocal
+        rank fusion. Without an embedding (e.g. when the embedding provider is down) hybrid
+        mode falls back to full text search alone.
+
+        With a `thread_depth`, results are expanded with the reply-thread neighbours of the
+        matches and of the message itself (`message_id`), up to `limit` more messages.
+        """
+        results = EMPTY_SEARCH_RESULTS
+        if embedding is not None:
+            with timed("vector_search"):
+                results = self._vector_search(chat_id=chat_id, embedding=embedding, before=before)
+
+        if self.mode == HYBRID_MODE and text:
+            with timed("full_text_search"):
+                text_ids = self._message_database.search_messages(
+                    chat_id=chat_id, 
+                    query=text, 
+                    before=before, 
+                    limit=self._limit
+                )
+            fused_ids = _reciprocal_rank_fusion(rankings=[results.ids.tolist(), text_ids], limit=self._limit)
+            results = _results_for(ids=fused_ids, results=results)
+
+        if self._thread_depth:
+            seed_ids = results.ids.tolist() + ([message_id] if message_id is not None else [])
+            with timed("thread_expansion"):
+                thread_ids = self._message_database.get_thread_ids(
+                    chat_id=chat_id,
+                    message_ids=seed_ids,
+                    depth=self._thread_depth,
+                    before=before,
+                    limit=self._limit
+                )
+            results = _results_for(ids=results.ids.tolist() + thread_ids, results=results)
+
+        return results
+
+    def _vector_search(self, chat_id: int, embedding: List[float], before: timedelta) -> SearchResults:
+        # Re-ranking by recency picks from a larger pool of candidates
+        limit = self._limit * RERANK_CANDIDATES if self._recency_half_life else self._limit
+
+        cutoff = (datetime.now(timezone.utc) - before).timestamp()
+        if self._matrix_index:
+            results, retained_since = self._matrix_index.search(
+                chat_id=chat_id, 
+                embedding=embedding, 
+                before=cutoff, 
+                limit=limit
+            )
+
+            # Messages older than a trimmed matrix are only in LanceDB
+            if retained_since is not None:
+                older = self._lancedb_search(
+                    chat_id=chat_id, 
+                    embedding=embedding, 
+                    before=min(cutoff, retained_since), 
+                    limit=limit
+                )
+                results = SearchResults(*(np.concatenate(pair) for pair in zip(results, older)))
+                results = results.take(np.argsort(results.distances, kind="stable")[:limit])
+        else:
+            results = self._lancedb_search(chat_id=chat_id, embedding=embedding, before=cutoff, limit=limit)
+
+        if self._max_distance is not None:
+            results = results.take(results.distances <= self._max_distance)
+
+        if self._recency_half_life:
+            ages = datetime.now(timezone.utc).timestamp() - results.created_at
+            scores = 0.5 ** (ages / self._recency_half_life.total_seconds()) / (1 + results.distances)
+            results = results.take(np.argsort(-scores, kind="stable")[:self._limit])
+
+        return results
+
+    def _lancedb_search(self, chat_id: int, embedding: List[float], before: float, limit: int) -> SearchResults:
+        # Only the id, timestamp and distance are read, not the stored embeddings
+        matches = (
+            self.table.search(embedding)
+            .where(f"chat_id = {chat_id} AND created_at < {before}")
+            .select(["id", "created_at", "_distance"])
+            .limit(limit)
+            .to_arrow()
+        )
+        return SearchResults(
+            ids=matches["id"].to_numpy(),
+            distances=matches["_distance"].to_numpy().astype(np.float32, copy=False),
+            created_at=matches["created_at"].to_numpy()
+        )
+
+    def _load_chat(self, chat_id: int) -> pa.Table:
+        return self.table.to_lance().to_table(
+            columns=["id", "created_at", "embedding"], 
+            filter=f"chat_id = {chat_id}"
+        )
+
+    def _count_chat(self, chat_id: int, since: float | None) -> int:
+        since_filter = f" AND created_at >= {since}" if since is not None else ""
+        return self.table.count_rows(f"chat_id = {chat_id}{since_filter}")
+
+class ChatMatrixIndex:
+    """Vector search over per-chat embedding matrices, memory-mapped from disk.
+
+    Each chat's embeddings are kept in a contiguous float32 matrix alongside arrays of
+    message ids, timestamps and squared norms, each in its own file that is appended to as
+    messages arrive. A search is a single matrix-vector product over the rows before the
+    cutoff (found by binary search when timestamps are sorted) followed by `argpartition`,
+    which avoids the fixed per-query overhead of LanceDB on small and medium chats.
+
+    LanceDB stays the source of truth: a chat's files are built from the LanceDB table the
+    first time the chat is searched, and mirror its writes from then on. The first search
+    of a chat in a process compares the matrix's row count with LanceDB's and rebuilds it
+    when they differ, which repairs writes lost to a crash between both. Distances are
+    squared L2, like LanceDB's default metric.
+
+    Only the `max_rows` most recent rows of a chat are kept. Once appends grow a matrix
+    past the cap (plus some slack) it is rebuilt from its most recent rows, and searches
+    return the time from which rows are retained so older ones can be searched in LanceDB.
+    """
+
+    def __init__(
+        self, 
+        path: Path, 
+        dimensions: int, 
+        load_chat: Callable[[int], pa.Table], 
+        count_chat: Callable[[int, float | None], int],
+        max_rows: int = MATRIX_MAX_ROWS
+    ):
+        self._path = path
+        self._dimensions = dimensions
+        self._load_chat = load_chat
+        self._count_chat = count_chat
+        self._max_rows = max_rows
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._matrices: Dict[int, _ChatMatrix] = {}
+
+        # Chats checked against LanceDB since the process started
+        self._validated: Set[int] = set()
+
+    def lock(self, chat_id: int) -> threading.Lock:
+        """Lock a chat's matrix, held while writing to LanceDB so both stay in sync."""
+        with self._locks_lock:
+            return self._locks.setdefault(chat_id, threading.Lock())
+
+    def append(self, chat_id: int, ids: np.ndarray, timestamps: np.ndarray, embeddings: np.ndarray):
+        """Append rows to a chat's matrix. Must be called holding the chat's lock."""
+        matrix = self._open(chat_id)
+        if matrix is None:
+            # Not loaded yet, the rows are picked up from LanceDB once it is
+            return
+
+        chat_path = self._chat_path(chat_id)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self._dimensions)
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+
+        # Rows older than a trimmed matrix only live in LanceDB
+        if matrix.retained_since is not None:
+            retained = timestamps >= matrix.retained_since
+            ids, timestamps, embeddings = ids[retained], timestamps[retained], embeddings[retained]
+            if len(ids) == 0:
+                return
+
+        # Ids are written last, their count marks how many rows are complete. Rows left
+        # incomplete by an interrupted append are dropped first, so files stay aligned.
+        count = (chat_path / IDS_FILE).stat().st_size // np.dtype(np.int64).itemsize
+        for name, row_size in (
+            (EMBEDDINGS_FILE, 4 * self._dimensions), 
+            (NORMS_FILE, 4), 
+            (TIMESTAMPS_FILE, 8)
+        ):
+            if (chat_path / name).stat().st_size > count * row_size:
+                os.truncate(chat_path / name, count * row_size)
+
+        for name, values in (
+            (EMBEDDINGS_FILE, embeddings),
+            (NORMS_FILE, np.einsum("ij,ij->i", embeddings, embeddings)),
+            (TIMESTAMPS_FILE, timestamps),
+            (IDS_FILE, ids),
+        ):
+            with open(chat_path / name, "ab") as matrix_file:
+                matrix_file.write(values.tobytes())
+
+        if count + len(ids) > self._max_rows * (1 + MATRIX_TRIM_SLACK):
+            self._build(chat_id)
+
+    def upsert(self, chat_id: int, ids: np.ndarray, timestamps: np.ndarray, embeddings: np.ndarray):
+        """Overwrite rows of existing ids in place and append the others. Must hold the chat's lock."""
+        matrix = self._open(chat_id)
+        if matrix is None:
+            return
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self._dimensions)
+        rows = _find_rows(matrix.ids, ids)
+        found = rows >= 0
+
+        if found.any():
+            chat_path = self._chat_path(chat_id)
+            found_embeddings = embeddings[found]
+            for name, dtype, values in (
+                (EMBEDDINGS_FILE, np.float32, found_embeddings),
+                (NORMS_FILE, np.float32, np.einsum("ij,ij->i", found_embeddings, found_embeddings)),
+                (TIMESTAMPS_FILE, np.float64, np.asarray(timestamps, dtype=np.float64)[found]),
+            ):
+                writable = np.memmap(chat_path / name, dtype=dtype, mode="r+")
+                if values.ndim == 2:
+                    writable = writable.reshape(-1, self._dimensions)
+                writable[rows[found]] = values
+                writable.flush()
+            self._matrices.pop(chat_id, None)
+
+        if not found.all():
+            self.append(
+                chat_id=chat_id, 
+                ids=np.asarray(ids)[~found], 
+                timestamps=np.asarray(timestamps)[~found], 
+                embeddings=embeddings[~found]
+            )
+
+    def delete(self, chat_id: int, ids: np.ndarray):
+        """Tombstone rows of the given ids. Must hold the chat's lock."""
+        matrix = self._open(chat_id)
+        if matrix is None:
+            return
+
+        rows = _find_rows(matrix.ids, ids)
+        rows = rows[rows >= 0]
+        if len(rows):
+            writable = np.memmap(self._chat_path(chat_id) / IDS_FILE, dtype=np.int64, mode="r+")
+            writable[rows] = DELETED_ID
+            writable.flush()
+
+    def search(self, chat_id: int, embedding: List[float], before: float, limit: int) -> Tuple[SearchResults, float | None]:
+        """Find the `limit` nearest rows created before `before`.
+
+        Returns the results and the time from which the chat's rows are retained, None
+        when the matrix holds all of them.
+        """
+        with self.lock(chat_id):
+            matrix = self._open(chat_id)
+            if matrix is None or (chat_id not in self._validated and not self._in_sync(chat_id=chat_id, matrix=matrix)):
+                matrix = self._build(chat_id)
+            self._validated.add(chat_id)
+
+        if matrix.sorted:
+            count = int(np.searchsorted(matrix.timestamps, before, side="left"))
+            candidates = slice(0, count)
+        else:
+            candidates = np.flatnonzero(matrix.timestamps < before)
+            count = len(candidates)
+
+        if count == 0:
+            return EMPTY_SEARCH_RESULTS, matrix.retained_since
+
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = matrix.norms[candidates] - 2 * (matrix.embeddings[candidates] @ query) + query @ query
+        ids = matrix.ids[candidates]
+        distances[ids == DELETED_ID] = np.inf
+
+        k = min(limit, count)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        nearest = nearest[np.isfinite(distances[nearest])]
+
+        # A row appended while another process rebuilt the matrix can appear twice
+        _, first = np.unique(ids[nearest], return_index=True)
+        nearest = nearest[np.sort(first)]
+
+        return SearchResults(
+            ids=np.array(ids[nearest]), 
+            distances=distances[nearest], 
+            created_at=np.array(matrix.timestamps[candidates][nearest])
+        ), matrix.retained_since
+
+    def _chat_path(self, chat_id: int) -> Path:
+        return self._path / str(chat_id)
+
+    def _open(self, chat_id: int) -> "_ChatMatrix | None":
+        chat_path = self._chat_path(chat_id)
+        ids_path = chat_path / IDS_FILE
+        if not ids_path.exists():
+            return None
+
+        # Reuse the mapping until rows are appended or the chat is rebuilt
+        stat = ids_path.stat()
+        key = (stat.st_ino, stat.st_size)
+        matrix = self._matrices.get(chat_id)
+        if matrix is not None and matrix.key == key:
+            return matrix
+
+        retained_since = None
+        if (chat_path / META_FILE).exists():
+            with open(chat_path / META_FILE, "r") as meta_file:
+                retained_since = json.load(meta_file).get("retained_since")
+
+        count = stat.st_size // np.dtype(np.int64).itemsize
+        if count == 0:
+            matrix = _ChatMatrix(
+                key=key,
+                retained_since=retained_since,
+                ids=np.empty(0, dtype=np.int64),
+                timestamps=np.empty(0, dtype=np.float64),
+                norms=np.empty(0, dtype=np.float32),
+                embeddings=np.empty((0, self._dimensions), dtype=np.float32)
+            )
+        else:
+            timestamps = np.memmap(chat_path / TIMESTAMPS_FILE, dtype=np.float64, mode="r")[:count]
+            matrix = _ChatMatrix(
+                key=key,
+                retained_since=retained_since,
+                ids=np.memmap(ids_path, dtype=np.int64, mode="r")[:count],
+                timestamps=timestamps,
+                norms=np.memmap(chat_path / NORMS_FILE, dtype=np.float32, mode="r")[:count],
+                embeddings=(
+                    np.memmap(chat_path / EMBEDDINGS_FILE, dtype=np.float32, mode="r")
+                    .reshape(-1, self._dimensions)[:count]
+                )
+            )
+
+        self._matrices[chat_id] = matrix
+        return matrix
+
+    def _in_sync(self, chat_id: int, matrix: "_ChatMatrix") -> bool:
+        rows = int(np.count_nonzero(matrix.ids != DELETED_ID))
+        expected_rows = self._count_chat(chat_id, matrix.retained_since)
+        if rows != expected_rows:
+            logger.info(f"rag_matrix_stale - chat_id: {chat_id} - rows: {rows} - expected: {expected_rows}")
+            return False
+        return True
+
+    def _build(self, chat_id: int) -> "_ChatMatrix":
+        rows = self._load_chat(chat_id).sort_by("created_at")
+
+        # Rows sharing the oldest retained timestamp are all kept, so the cutoff is a point in time
+        retained_since = None
+        if len(rows) > self._max_rows:
+            timestamps = rows["created_at"].to_numpy()
+            retained_since = float(timestamps[len(rows) - self._max_rows])
+            rows = rows.slice(int(np.searchsorted(timestamps, retained_since, side="left")))
+
+        embeddings = rows["embedding"].combine_chunks().flatten().to_numpy().reshape(-1, self._dimensions)
+
+        # Written aside and renamed, so a chat is never seen half built
+        chat_path = self._chat_path(chat_id)
+        building_path = self._path / f"{chat_id}.{os.getpid()}.tmp"
+        building_path.mkdir(parents=True, exist_ok=True)
+        with open(building_path / META_FILE, "w") as meta_file:
+            json.dump({"retained_since": retained_since}, meta_file)
+        for name, values in (
+            (EMBEDDINGS_FILE, np.ascontiguousarray(embeddings, dtype=np.float32)),
+            (NORMS_FILE, np.einsum("ij,ij->i", embeddings, embeddings).astype(np.float32)),
+            (TIMESTAMPS_FILE, rows["created_at"].to_numpy().astype(np.float64)),
+            (IDS_FILE, rows["id"].to_numpy().astype(np.int64)),
+        ):
+            with open(building_path / name, "wb") as matrix_file:
+                matrix_file.write(values.tobytes())
+
+        # Mappings of the replaced files stay valid until they are dropped
+        stale_path = self._path / f"{chat_id}.{os.getpid()}.stale"
+        try:
+            chat_path.rename(stale_path)
+        except FileNotFoundError:
+            # Not built yet, or another process replaced it in the meantime
+            pass
+        shutil.rmtree(stale_path, ignore_errors=True)
+        try:
+            building_path.rename(chat_path)
+        except OSError:
+            # Another process built the chat in the meantime
+            shutil.rmtree(building_path, ignore_errors=True)
+
+        matrix = self._open(chat_id)
+        assert matrix is not None
+        return matrix
+
+class _ChatMatrix:
+    def __init__(
+        self, 
+        key: Tuple[int, int], 
+        retained_since: float | None, 
+        ids: np.ndarray, 
+        timestamps: np.ndarray, 
+        norms: np.ndarray, 
+        embeddings: np.ndarray
+    ):
+        self.key = key
+        self.retained_since = retained_since
+        self.ids = ids
+        self.timestamps = timestamps
+        self.norms = norms
+        self.embeddings = embeddings
+
+        # Messages mostly arrive in order, which allows a binary search on the cutoff
+        self.sorted = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+def _find_rows(ids: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    # Row of each target id, or -1 when it isn't in the matrix
+    targets = np.asarray(targets, dtype=np.int64)
+    if len(ids) == 0:
+        return np.full(len(targets), -1, dtype=np.int64)
+
+    order = np.argsort(ids, kind="stable")
+    positions = np.minimum(np.searchsorted(ids[order], targets), len(ids) - 1)
+    return np.where(ids[order][positions] == targets, order[positions], -1)
+
+def embeddings_schema(dimensions: int) -> pa.Schema:
+    return pa.schema([
+        pa.field("id", pa.int64()),
+        pa.field("chat_id", pa.int64()),
+        pa.field("created_at", pa.float64()),
+        pa.field("embedding", pa.list_(pa.float32(), dimensions)),
+    ])
+
+def upsert_embeddings(
+    table: lancedb.table.Table, 
+    ids: List[int], 
+    chat_ids: List[int], 
+    timestamps: List[float], 
+    embeddings: np.ndarray
+) -> pa.Table:
+    """Insert or replace embeddings by (id, chat_id) with one merge, so writing the same rows twice is harmless."""
+    dimensions = embeddings.shape[1]
+    rows = pa.Table.from_pydict(
+        {
+            "id": ids,
+            "chat_id": chat_ids,
+            "created_at": timestamps,
+            "embedding": pa.FixedSizeListArray.from_arrays(
+                pa.array(np.asarray(embeddings, dtype=np.float32).ravel(), type=pa.float32()),
+                dimensions
+            ),
+        },
+        schema=embeddings_schema(dimensions=dimensions)
+    )
+    (
+        table.merge_insert(["id", "chat_id"])
+        .when_matched_update_all()
+        .when_not_matched_insert_all()
+        .execute(rows)
+    )
+    return rows
+
+def utc_timestamp(created_at: datetime) -> float:
+    # SQLite returns naive datetimes, which are stored in UTC
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+def read_active_table(path: Path) -> Dict[str, Any] | None:
+    active_table_path = path / ACTIVE_TABLE_FILE
+    if not active_table_path.exists():
+        return None
+    
+    with open(active_table_path, "r") as active_table_file:
+        return json.load(active_table_file)
+
+def write_active_table(path: Path, table_name: str, model: str, dimensions: int, after_rowid: int | None = None):
+    """Point the store at a table. With `after_rowid`, messages stored after that rowid are embedded on the next start."""
+    active_table = {"table": table_name, "model": model, "dimensions": dimensions}
+    if after_rowid is not None:
+        active_table["after_rowid"] = after_rowid
+
+    # Written aside and renamed, so readers never see a partially written file
+    temporary_path = path / f"{ACTIVE_TABLE_FILE}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as active_table_file:
+        json.dump(active_table, active_table_file)
+    os.replace(temporary_path, path / ACTIVE_TABLE_FILE)
+
+def _results_for(ids: List[int], results: SearchResults) -> SearchResults:
+    # Scores of messages matched by vector search are kept, other messages have none
+    ids = list(dict.fromkeys(ids))
+    scores = dict(zip(results.ids.tolist(), zip(results.distances.tolist(), results.created_at.tolist())))
+    return SearchResults(
+        ids=np.array(ids, dtype=np.int64),
+        distances=np.array([scores.get(message_id, (np.nan, np.nan))[0] for message_id in ids], dtype=np.float32),
+        created_at=np.array([scores.get(message_id, (np.nan, np.nan))[1] for message_id in ids], dtype=np.float64)
+    )
+
+def _reciprocal_rank_fusion(rankings: List[List[int]], limit: int) -> List[int]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, message_id in enumerate(ranking):
+            scores[message_id] = scores.get(message_id, 0) + 1 / (RRF_K + rank + 1)
+
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
@@ -0,0 +1,180 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import lancedb
+import numpy as np
+from pathlib import Path
+import re
+from sqlalchemy import create_engine, literal_column, select
+import time
+
+from database import embedded_messages, Message
+from embedding import parse_embedding
+from embedding.client import EmbeddingClient
+from logger import configure_logger, logger
+from rag import embeddings_schema, read_active_table, TABLE_NAME, upsert_embeddings, utc_timestamp, write_active_table
+
+# Tracks progress of an unfinished reindex, so it resumes where it stopped
+CHECKPOINT_FILE = "reindex.json"
+
+VERSIONED_TABLE_PATTERN = re.compile(rf"^{TABLE_NAME}_v(\d+)$")
+
+def reindex(folder_name: str, chunk_size: int, batch_size: int, concurrency: int):
+    """Re-embed a bot's message history into a new embeddings table.
+
+    Messages the bot embeds are streamed from SQLite in chunks, embedded in batches with at most
+    `concurrency` embedding requests in flight, and appended to a new versioned LanceDB
+    table. Progress is checkpointed after every chunk, so an interrupted run resumes where
+    it stopped, and chunks are upserted so one written before a crash isn't duplicated.
+    Once every message is embedded, the new table is atomically swapped in. Messages the
+    running bot stores after that are embedded into the new table when it restarts.
+    """
+    bot_path = Path("bots") / folder_name
+    config_path = bot_path / "config.json"
+    resources_path = bot_path / "resources"
+
+    configure_logger(path=resources_path / "reindex.log")
+
+    if not config_path.exists():
+        raise FileNotFoundError(f"config file not found: {config_path}")
+
+    with open(config_path, "r") as config_file:
+        config_json = json.load(config_file)
+
+    embedding_config_json = config_json.get("rag", {}).get("embedding")
+    if not embedding_config_json:
+        raise ValueError("config must contain rag embedding")
+
+    embedding_client = parse_embedding(embedding_config_json=embedding_config_json)
+
+    telegram_token = config_json.get("telegram_token")
+    if not telegram_token:
+        raise ValueError("config must contain telegram_token")
+
+    # The bot's own replies aren't embedded, its id is the first part of the token
+    bot_id = int(telegram_token.split(":")[0])
+
+    vector_database = lancedb.connect(resources_path)
+    checkpoint = _read_checkpoint(path=resources_path, embedding_client=embedding_client, vector_database=vector_database)
+    if checkpoint is None:
+        checkpoint = {
+            "table": _next_table_name(vector_database.table_names()),
+            "model": embedding_client.model,
+            "dimensions": embedding_client.dimensions,
+            "after_rowid": 0,
+            "rows": 0
+        }
+        table = vector_database.create_table(
+            checkpoint["table"],
+            schema=embeddings_schema(dimensions=embedding_client.dimensions)
+        )
+        # Checkpointed right away, so the table is resumed or dropped if the run stops early
+        _write_checkpoint(path=resources_path, checkpoint=checkpoint)
+        logger.info(f"reindex_started - table: {checkpoint['table']} - model: {embedding_client.model}")
+    else:
+        table = vector_database.open_table(checkpoint["table"])
+        logger.info(f"reindex_resumed - table: {checkpoint['table']} - after_rowid: {checkpoint['after_rowid']}")
+
+    engine = create_engine(f"sqlite:///{resources_path / 'bot.db'}", future=True)
+    started_at, started_rows = time.perf_counter(), checkpoint["rows"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            rows = _read_chunk(engine=engine, bot_id=bot_id, after_rowid=checkpoint["after_rowid"], chunk_size=chunk_size)
+            if not rows:
+                break
+
+            texts = [row.text for row in rows]
+            batches = [texts[index:index + batch_size] for index in range(0, len(texts), batch_size)]
+            embeddings = np.concatenate(list(executor.map(embedding_client.embed_batch, batches)))
+
+            upsert_embeddings(
+                table=table,
+                ids=[row.id for row in rows],
+                chat_ids=[row.chat_id for row in rows],
+                timestamps=[utc_timestamp(row.created_at) for row in rows],
+                embeddings=embeddings
+            )
+
+            checkpoint["after_rowid"] = rows[-1].rowid
+            checkpoint["rows"] += len(rows)
+            _write_checkpoint(path=resources_path, checkpoint=checkpoint)
+
+            rows_per_second = (checkpoint["rows"] - started_rows) / (time.perf_counter() - started_at)
+            logger.info(f"reindex_progress - rows: {checkpoint['rows']} - rows/sec: {rows_per_second:.0f}")
+
+    write_active_table(
+        path=resources_path,
+        table_name=checkpoint["table"],
+        model=embedding_client.model,
+        dimensions=embedding_client.dimensions,
+        after_rowid=checkpoint["after_rowid"]
+    )
+    (resources_path / CHECKPOINT_FILE).unlink()
+
+    elapsed = time.perf_counter() - started_at
+    logger.info(
+        f"reindex_finished - table: {checkpoint['table']} - rows: {checkpoint['rows']} - "
+        f"rows/sec: {(checkpoint['rows'] - started_rows) / elapsed if elapsed else 0:.0f}"
+    )
+    logger.info("Restart the bot to use the new embeddings table")
+
+def _read_chunk(engine, bot_id: int, after_rowid: int, chunk_size: int):
+    # Only messages the running bot embeds too
+    rowid = literal_column("messages.rowid")
+    with engine.connect() as conn:
+        return conn.execute(
+            select(rowid.label("rowid"), Message.id, Message.chat_id, Message.created_at, Message.text)
+            .where(rowid > after_rowid, embedded_messages(bot_id=bot_id))
+            .order_by(rowid)
+            .limit(chunk_size)
+        ).all()
+
+def _next_table_name(table_names) -> str:
+    versions = [
+        int(match.group(1))
+        for match in (VERSIONED_TABLE_PATTERN.match(table_name) for table_name in table_names)
+        if match
+    ]
+    return f"{TABLE_NAME}_v{max(versions, default=1) + 1}"
+
+def _read_checkpoint(path: Path, embedding_client: EmbeddingClient, vector_database) -> dict | None:
+    checkpoint_path = path / CHECKPOINT_FILE
+    if not checkpoint_path.exists():
+        return None
+
+    with open(checkpoint_path, "r") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+
+    # A checkpoint of another embedding config can't be resumed
+    if checkpoint["model"] != embedding_client.model or checkpoint["dimensions"] != embedding_client.dimensions:
+        # Its partially filled table is never used, unless it was somehow activated
+        active_table = read_active_table(path)
+        if checkpoint["table"] in vector_database.table_names() and (active_table or {}).get("table") != checkpoint["table"]:
+            vector_database.drop_table(checkpoint["table"])
+        logger.info(f"reindex_checkpoint_discarded - table: {checkpoint['table']}")
+        return None
+
+    return checkpoint
+
+def _write_checkpoint(path: Path, checkpoint: dict):
+    temporary_path = path / f"{CHECKPOINT_FILE}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    temporary_path.replace(path / CHECKPOINT_FILE)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Re-embed the message history of a Telegram bot into a new embeddings table."
+    )
+    arg_parser.add_argument("folder_name", type=str, help="Folder name of the Telegram bot")
+    arg_parser.add_argument("--chunk-size", type=int, default=5000, help="Messages read from the database at once")
+    arg_parser.add_argument("--batch-size", type=int, default=256, help="Messages per embedding request")
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight at once")
+    args = arg_parser.parse_args()
+    reindex(
+        folder_name=args.folder_name,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency
+    )
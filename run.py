@@ -1,24 +1,55 @@
 import argparse
+import asyncio
+from contextlib import AsyncExitStack
 from datetime import timedelta
 from functools import partial
 import json
+import logging
+from multiprocessing.queues import Queue
 from pathlib import Path
 from pytimeparse.timeparse import timeparse
+import signal
+import time
+from telegram import Update
 from telegram.ext import Application, ApplicationBuilder
+from typing import TYPE_CHECKING
 
-from bot import TelegramBot
-from database import Database
-from embedding.client import EmbeddingClient
-from embedding.openai import OpenAIEmbeddingClient
-from llm.client import LLMClient
-from llm.openai import OpenAILLMClient
-from llm.xai import XAILLMClient
-from logger import configure_logger, logger
-from rag import Rag
-from vision.client import VisionClient
-from vision.openai import OpenAIVisionClient
-
-def start(folder_name: str):
+from dispatcher import PerChatUpdateProcessor
+from logger import BotFilter, configure_logger, current_bot, logger
+from metrics import configure_tracing, MetricsServer, Pricing
+from stages import StageGraph
+from startup import import_modules, startup_profile
+from webhook import UpdateCallback, WebhookServer
+from workers import interprocess_lock, shard_key, ShardedWorkerPool, STORAGE_LOCK_FILE
+
+# Bots, storage and providers are imported on demand, the ingress process never needs them
+if TYPE_CHECKING:
+    from database import Database
+    from llm.client import LLMClient
+    from rag import Rag
+    from summary import Summarizer
+    from vision.client import VisionClient
+
+# Modules of each provider, preloaded while Telegram initializes
+LLM_MODULES = {"openai": "llm.openai", "xai": "llm.xai"}
+VISION_MODULES = {"openai": "vision.openai"}
+EMBEDDING_MODULES = {"openai": "embedding.openai", "local": "embedding.local"}
+
+def start(folder_names: list[str], workers: int, profile_startup: bool = False):
+    bots = [_load_bot(folder_name=folder_name) for folder_name in folder_names]
+
+    if workers > 0:
+        # Ingress only receives updates, handlers run in the worker processes
+        pool = ShardedWorkerPool(num_workers=workers, target=_run_worker, args=(folder_names, profile_startup))
+        pool.start()
+        try:
+            asyncio.run(_run_ingress(bots=bots, pool=pool))
+        finally:
+            pool.stop()
+    else:
+        asyncio.run(_run(bots=bots, profile_startup=profile_startup))
+
+def _load_bot(folder_name: str, log_name: str = "app.log", polling: bool = True) -> tuple[str, Application, dict]:
     bot_path = Path("bots") / folder_name
     config_path = bot_path / "config.json"
     identity_path = bot_path/ "identity.txt"
@@ -26,7 +57,7 @@ def start(folder_name: str):
     resources_path = bot_path / "resources"
     resources_path.mkdir(parents=True, exist_ok=True)
 
-    configure_logger(path=resources_path / "app.log")
+    file_handler = configure_logger(path=resources_path / log_name)
 
     if not config_path.exists():
         raise FileNotFoundError(f"config file not found: {config_path}")
@@ -44,11 +75,261 @@ def start(folder_name: str):
     if not telegram_token:
         raise ValueError("config must contain telegram_token")
     
-    telegram = ApplicationBuilder().token(telegram_token).build()
-    telegram.post_init = partial(telegram_post_init, config_json, identity, resources_path)
-    telegram.run_polling()
+    # Chats are handled concurrently, updates within a chat in order
+    telegram_builder = ApplicationBuilder().token(telegram_token).concurrent_updates(PerChatUpdateProcessor())
+    if not polling or "webhook" in config_json:
+        # Updates are pushed to the application, no polling updater needed
+        telegram_builder = telegram_builder.updater(None)
+
+    telegram = telegram_builder.build()
+    telegram.post_init = partial(telegram_post_init, config_json, identity, resources_path, file_handler)
+    return folder_name, telegram, config_json
+
+async def _run(bots: list[tuple[str, Application, dict]], profile_startup: bool = False):
+    webhook_server = WebhookServer()
+    metrics_server = MetricsServer()
+
+    async with AsyncExitStack() as stack:
+        await _start_telegrams(bots=bots, stack=stack)
+        for folder_name, telegram, config_json in bots:
+            await _start_ingestion(
+                folder_name=folder_name,
+                telegram=telegram,
+                config_json=config_json,
+                on_update=partial(_enqueue_update, telegram),
+                webhook_server=webhook_server,
+                stack=stack
+            )
+            _add_metrics(config_json=config_json, metrics_server=metrics_server)
+
+        if webhook_server.has_routes:
+            await webhook_server.start()
+            stack.push_async_callback(webhook_server.stop)
+
+        if metrics_server.has_addresses:
+            await metrics_server.start()
+            stack.push_async_callback(metrics_server.stop)
+
+        if profile_startup:
+            startup_profile.report()
+
+        await _wait_for_stop_signal()
+
+async def _run_ingress(bots: list[tuple[str, Application, dict]], pool: ShardedWorkerPool):
+    webhook_server = WebhookServer()
+
+    async with AsyncExitStack() as stack:
+        for folder_name, telegram, config_json in bots:
+            # Only initialized to receive updates, handlers are never registered here
+            await stack.enter_async_context(telegram)
+            await _start_ingestion(
+                folder_name=folder_name,
+                telegram=telegram,
+                config_json=config_json,
+                on_update=partial(_dispatch_update, pool, folder_name),
+                webhook_server=webhook_server,
+                stack=stack
+            )
+
+        if webhook_server.has_routes:
+            await webhook_server.start()
+            stack.push_async_callback(webhook_server.stop)
+
+        # A worker only exits when stopped, otherwise the chats of its shard would go unhandled
+        stop_signal = asyncio.create_task(_wait_for_stop_signal())
+        worker_exit = asyncio.create_task(pool.wait_for_exit())
+        await asyncio.wait([stop_signal, worker_exit], return_when=asyncio.FIRST_COMPLETED)
+        stop_signal.cancel()
+        worker_exit.cancel()
+
+        if worker_exit.done() and not worker_exit.cancelled():
+            worker_index, exitcode = worker_exit.result()
+            raise RuntimeError(f"worker {worker_index} exited unexpectedly with code {exitcode}")
+
+def _run_worker(worker_index: int, queue: Queue, folder_names: list[str], profile_startup: bool = False):
+    # Interrupts are handled by the ingress process, which stops workers via their queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    bots = [
+        _load_bot(folder_name=folder_name, log_name=f"app.worker{worker_index}.log", polling=False) 
+        for folder_name in folder_names
+    ]
+    asyncio.run(_run_worker_bots(bots=bots, queue=queue, worker_index=worker_index, profile_startup=profile_startup))
+
+async def _run_worker_bots(
+    bots: list[tuple[str, Application, dict]], 
+    queue: Queue, 
+    worker_index: int, 
+    profile_startup: bool = False
+):
+    telegrams: dict[str, Application] = {}
+    metrics_server = MetricsServer()
+
+    async with AsyncExitStack() as stack:
+        await _start_telegrams(bots=bots, stack=stack)
+        for folder_name, telegram, config_json in bots:
+            telegrams[folder_name] = telegram
+
+            # Every worker serves its own metrics, on the ports following the configured one
+            _add_metrics(config_json=config_json, metrics_server=metrics_server, port_offset=worker_index + 1)
+
+        if metrics_server.has_addresses:
+            await metrics_server.start()
+            stack.push_async_callback(metrics_server.stop)
+
+        if profile_startup:
+            startup_profile.report()
+
+        loop = asyncio.get_running_loop()
+        while (item := await loop.run_in_executor(None, queue.get)) is not None:
+            folder_name, update_json = item
+            try:
+                await _enqueue_update(telegrams[folder_name], update_json)
+            except Exception as e:
+                # A malformed update must not stop the worker
+                logger.error(f"update_rejected - update_id: {update_json.get('update_id')} - error: {e}")
+
+async def _start_telegrams(bots: list[tuple[str, Application, dict]], stack: AsyncExitStack):
+    # Modules of all bots are imported off the event loop while Telegram initializes
+    modules = _required_modules(config_jsons=[config_json for _, _, config_json in bots])
+    preload = asyncio.create_task(asyncio.to_thread(import_modules, modules))
+
+    # Bots start concurrently. None is cancelled when another fails, as cancelling
+    # Application.initialize midway would leak its HTTP clients: every bot either
+    # registers its cleanup on the stack or cleans up itself, then the first error is raised.
+    try:
+        results = await asyncio.gather(
+            *(_start_telegram(telegram=telegram, stack=stack, preload=preload) for _, telegram, _ in bots),
+            return_exceptions=True
+        )
+    finally:
+        # The import thread can't be interrupted, it's waited for before unwinding
+        await asyncio.gather(preload, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+async def _start_telegram(telegram: Application, stack: AsyncExitStack, preload: asyncio.Task):
+    # Application context initializes on enter and shuts down on exit
+    started_at = time.perf_counter()
+    try:
+        await stack.enter_async_context(telegram)
+    except Exception:
+        # Application.shutdown skips an application whose initialize failed, e.g. on getMe
+        await telegram.bot.shutdown()
+        raise
+    startup_profile.record(phase="init", component=f"{telegram.bot.username}/telegram", seconds=time.perf_counter() - started_at)
+
+    await preload
+    if telegram.post_init:
+        await telegram.post_init(telegram)
+    if telegram.post_stop:
+        # Runs after the application stopped handling updates
+        stack.push_async_callback(telegram.post_stop, telegram)
+    await telegram.start()
+    stack.push_async_callback(telegram.stop)
+
+def _required_modules(config_jsons: list[dict]) -> list[str]:
+    # Storage first, it is shared by every bot, unknown providers are reported when parsed
+    modules = ["database", "rag"]
+    for config_json in config_jsons:
+        for provider in config_json.get("llm", {}):
+            modules.append(LLM_MODULES.get(provider, ""))
+        for provider in config_json.get("vision", {}):
+            modules.append(VISION_MODULES.get(provider, ""))
+        for provider in config_json.get("rag", {}).get("embedding", {}):
+            modules.append(EMBEDDING_MODULES.get(provider, ""))
+    modules.extend(["summary", "bot"])
+    return list(dict.fromkeys(module for module in modules if module))
+
+async def _start_ingestion(
+    folder_name: str, 
+    telegram: Application, 
+    config_json, 
+    on_update: UpdateCallback, 
+    webhook_server: WebhookServer, 
+    stack: AsyncExitStack
+):
+    webhook_config_json = config_json.get("webhook")
+    if webhook_config_json:
+        await _add_webhook(
+            webhook_config_json=webhook_config_json, 
+            default_path=folder_name, 
+            telegram=telegram, 
+            on_update=on_update,
+            webhook_server=webhook_server
+        )
+    elif telegram.updater:
+        await telegram.updater.start_polling()
+        stack.push_async_callback(telegram.updater.stop)
+
+        # Polled updates are consumed by the running application itself
+        if not telegram.running:
+            forward_task = asyncio.create_task(_forward_polled_updates(telegram=telegram, on_update=on_update))
+            stack.callback(forward_task.cancel)
+
+async def _forward_polled_updates(telegram: Application, on_update: UpdateCallback):
+    while True:
+        update = await telegram.update_queue.get()
+        if isinstance(update, Update):
+            await on_update(update.to_dict())
+
+async def _wait_for_stop_signal():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+    await stop_event.wait()
+
+async def _add_webhook(
+    webhook_config_json, 
+    default_path: str, 
+    telegram: Application, 
+    on_update: UpdateCallback, 
+    webhook_server: WebhookServer
+):
+    port = webhook_config_json.get("port")
+    if not port:
+        raise ValueError("webhook config must contain port")
+    
+    listen = webhook_config_json.get("listen", "127.0.0.1")
+    path = webhook_config_json.get("path", default_path)
+    secret_token = webhook_config_json.get("secret_token")
+
+    webhook_server.add_route(
+        path=path,
+        listen=listen,
+        port=port,
+        on_update=on_update,
+        secret_token=secret_token
+    )
+
+    # Without a public url the webhook is not registered with Telegram, which allows local testing
+    url = webhook_config_json.get("url")
+    if url:
+        webhook_url = f"{url.rstrip('/')}/{path.strip('/')}"
+        await telegram.bot.set_webhook(url=webhook_url, secret_token=secret_token)
+        logger.info(f"Webhook registered: {webhook_url}")
+
+def _add_metrics(config_json, metrics_server: MetricsServer, port_offset: int = 0):
+    metrics_config_json = config_json.get("metrics")
+    if not metrics_config_json:
+        return
+    
+    port = metrics_config_json.get("port")
+    if not port:
+        raise ValueError("metrics config must contain port")
+    
+    metrics_server.add_address(listen=metrics_config_json.get("listen", "127.0.0.1"), port=port + port_offset)
+
+async def _enqueue_update(telegram: Application, update_json: dict):
+    await telegram.update_queue.put(Update.de_json(update_json, telegram.bot))
+
+async def _dispatch_update(pool: ShardedWorkerPool, folder_name: str, update_json: dict):
+    await pool.dispatch(key=shard_key(update_json), item=(folder_name, update_json))
     
-def _parse_llm(llm_config_json, bot_id: int) -> LLMClient:
+def _parse_llm(llm_config_json, bot_id: int) -> "LLMClient":
     if "openai" in llm_config_json:
         openai_llm_config_json = llm_config_json["openai"]
 
@@ -60,6 +341,8 @@ def _parse_llm(llm_config_json, bot_id: int) -> LLMClient:
         if not model:
             raise ValueError("openai llm config must contain model")
         
+        from llm.openai import OpenAILLMClient
+
         return OpenAILLMClient(api_key=api_key, model=model, bot_id=bot_id)
     elif "xai" in llm_config_json:
         xai_llm_config_json = llm_config_json["xai"]
@@ -72,11 +355,25 @@ def _parse_llm(llm_config_json, bot_id: int) -> LLMClient:
         if not model:
             raise ValueError("xai llm config must contain model")
         
+        from llm.xai import XAILLMClient
+
         return XAILLMClient(api_key=api_key, model=model, bot_id=bot_id)
     else:
         raise ValueError(f"llm config contained unsupported provider: {llm_config_json}")
     
-def _parse_vision(vision_config_json) -> VisionClient:
+def _parse_llm_pricing(llm_config_json) -> Pricing | None:
+    # Pricing lives next to the model in the provider's config
+    provider_config_json = next(iter(llm_config_json.values()), {})
+    pricing_config_json = provider_config_json.get("pricing")
+    if not pricing_config_json:
+        return None
+    
+    if "input" not in pricing_config_json or "output" not in pricing_config_json:
+        raise ValueError("llm pricing config must contain input and output")
+    
+    return Pricing(input=pricing_config_json["input"], output=pricing_config_json["output"])
+    
+def _parse_vision(vision_config_json) -> "VisionClient":
     if "openai" in vision_config_json:
         openai_vision_config_json = vision_config_json["openai"]
 
@@ -88,11 +385,29 @@ def _parse_vision(vision_config_json) -> VisionClient:
         if not model:
             raise ValueError("openai vision config must contain model")
         
+        from vision.openai import OpenAIVisionClient
+
         return OpenAIVisionClient(api_key=api_key, model=model)
     else:
         raise ValueError(f"vision config contained unsupported provider: {vision_config_json}")
 
-def _parse_rag(rag_config_json, path: Path) -> Rag:    
+def _create_database(path: Path, admin_user_id: int, bot_id: int, bot_name: str, bot_username: str) -> "Database":
+    from database import Database
+
+    # Worker processes start at once, only the first one creates the schema and full text index
+    with interprocess_lock(path / STORAGE_LOCK_FILE):
+        return Database(
+            path=path, 
+            admin_user_id=admin_user_id, 
+            bot_id=bot_id, 
+            bot_name=bot_name, 
+            bot_username=bot_username
+        )
+
+def _parse_rag(rag_config_json, path: Path, database: "Database") -> "Rag":
+    from embedding import parse_embedding
+    from rag import HYBRID_MODE, LANCEDB_ENGINE, MATRIX_ENGINE, MATRIX_MAX_ROWS, Rag, VECTOR_MODE
+
     limit = rag_config_json.get("limit")
     if not limit:
         raise ValueError("rag config must contain limit")
@@ -101,31 +416,73 @@ def _parse_rag(rag_config_json, path: Path) -> Rag:
     if not embedding_config_json:
         raise ValueError("rag config must contain embedding")
     
-    embedding_client = _parse_embedding(embedding_config_json=embedding_config_json)
+    embedding_client = parse_embedding(embedding_config_json=embedding_config_json)
+
+    mode = rag_config_json.get("mode", VECTOR_MODE)
+    if mode not in (VECTOR_MODE, HYBRID_MODE):
+        raise ValueError(f"rag config contained unsupported mode: {mode}")
+
+    embedding_timeout = rag_config_json.get("embedding_timeout")
 
-    return Rag(path=path, embedding_client=embedding_client, limit=limit)
+    recency_half_life = None
+    recency_half_life_string = rag_config_json.get("recency_half_life")
+    if recency_half_life_string:
+        recency_half_life_seconds = timeparse(recency_half_life_string)
+        if recency_half_life_seconds is None:
+            raise ValueError(f"rag config recency_half_life is malformed: {recency_half_life_string}")
+        recency_half_life = timedelta(seconds=recency_half_life_seconds)
+
+    engine = rag_config_json.get("engine", LANCEDB_ENGINE)
+    if engine not in (LANCEDB_ENGINE, MATRIX_ENGINE):
+        raise ValueError(f"rag config contained unsupported engine: {engine}")
+
+    matrix_max_rows = rag_config_json.get("matrix_max_rows", MATRIX_MAX_ROWS)
+    if matrix_max_rows < 1:
+        raise ValueError("rag config matrix_max_rows must be at least 1")
+
+    return Rag(
+        path=path, 
+        embedding_client=embedding_client, 
+        limit=limit, 
+        database=database, 
+        mode=mode, 
+        embedding_timeout=embedding_timeout,
+        engine=engine,
+        max_distance=rag_config_json.get("max_distance"),
+        recency_half_life=recency_half_life,
+        thread_depth=rag_config_json.get("thread_depth"),
+        matrix_max_rows=matrix_max_rows
+    )
     
-def _parse_embedding(embedding_config_json) -> EmbeddingClient:
-    if "openai" in embedding_config_json:
-        openai_embedding_config_json = embedding_config_json["openai"]
+def _parse_summary(
+    summary_config_json, 
+    database: "Database", 
+    llm: "LLMClient", 
+    bot_name: str, 
+    context_window: timedelta,
+    llm_pricing: Pricing | None
+) -> "Summarizer":
+    from summary import Summarizer
 
-        api_key = openai_embedding_config_json.get("api_key")
-        if not api_key:
-            raise ValueError("openai embedding config must contain api_key")
-        
-        model = openai_embedding_config_json.get("model")
-        if not model:
-            raise ValueError("openai embedding config must contain model")
-        
-        dimensions = openai_embedding_config_json.get("dimensions")
-        if not dimensions:
-            raise ValueError("openai embedding config must contain model")
-        
-        return OpenAIEmbeddingClient(api_key=api_key, model=model, dimensions=dimensions)
-    else:
-        raise ValueError(f"embedding config contained unsupported provider: {embedding_config_json}")
+    recent_messages = summary_config_json.get("recent_messages", 50)
+    if recent_messages < 1:
+        raise ValueError("summary config recent_messages must be at least 1")
+    
+    segment_size = summary_config_json.get("segment_size", 100)
+    if segment_size < 1:
+        raise ValueError("summary config segment_size must be at least 1")
+    
+    return Summarizer(
+        database=database, 
+        llm=llm, 
+        bot_name=bot_name, 
+        context_window=context_window, 
+        recent_messages=recent_messages, 
+        segment_size=segment_size,
+        llm_pricing=llm_pricing
+    )
 
-async def telegram_post_init(config_json, identity: str, path: Path, self: Application):
+async def telegram_post_init(config_json, identity: str, path: Path, file_handler: logging.Handler, self: Application):
     admin_user_id = config_json.get("admin_user_id")
     if not admin_user_id:
         raise ValueError("config must contain admin_user_id")
@@ -147,31 +504,73 @@ async def telegram_post_init(config_json, identity: str, path: Path, self: Appli
     if not llm_config_json:
         raise ValueError("config must contain llm")
     
-    llm = _parse_llm(llm_config_json=llm_config_json, bot_id=self.bot.id)
+    llm_pricing = _parse_llm_pricing(llm_config_json=llm_config_json)
+
+    # Spans are exported once configured, the first bot of a process picks the file
+    if config_json.get("metrics", {}).get("tracing"):
+        configure_tracing(path=path / "spans.log")
 
     vision_config_json = config_json.get("vision")
     if not vision_config_json:
         raise ValueError("config must contain vision")
-    
-    vision = _parse_vision(vision_config_json=vision_config_json)
 
     rag_config_json = config_json.get("rag")
     if not rag_config_json:
         raise ValueError("config must contain rag")
     
-    rag = _parse_rag(rag_config_json=rag_config_json, path=path)
+    summary_config_json = config_json.get("summary")
+
+    from bot import TelegramBot
 
     bot_id = self.bot.id
     bot_name = self.bot.first_name
     bot_username = self.bot.username
 
-    database = Database(
-        path=path,
-        admin_user_id=admin_user_id,
-        bot_id=bot_id, 
-        bot_name=bot_name, 
-        bot_username=bot_username
+    # Records logged from here on are tagged with the bot, its file only keeps its own
+    current_bot.set(bot_username)
+    file_handler.addFilter(BotFilter(bot=bot_username))
+
+    # Components are created off the event loop, each as soon as the ones it needs exist
+    stages = StageGraph(label=f"startup - bot: {bot_username}")
+    stages.add("llm", partial(asyncio.to_thread, _parse_llm, llm_config_json=llm_config_json, bot_id=bot_id))
+    stages.add("vision", partial(asyncio.to_thread, _parse_vision, vision_config_json=vision_config_json))
+    stages.add(
+        "database", 
+        partial(
+            asyncio.to_thread, 
+            _create_database, 
+            path=path, 
+            admin_user_id=admin_user_id, 
+            bot_id=bot_id, 
+            bot_name=bot_name, 
+            bot_username=bot_username
+        )
     )
+    stages.add(
+        "rag", 
+        partial(asyncio.to_thread, _parse_rag, rag_config_json=rag_config_json, path=path), 
+        depends_on=["database"]
+    )
+    if summary_config_json is not None:
+        stages.add(
+            "summarizer",
+            partial(
+                asyncio.to_thread, 
+                _parse_summary, 
+                summary_config_json=summary_config_json, 
+                bot_name=bot_name, 
+                context_window=context_window,
+                llm_pricing=llm_pricing
+            ),
+            depends_on=["database", "llm"]
+        )
+
+    components = await stages.run()
+    for name, seconds in stages.timings.items():
+        startup_profile.record(phase="init", component=f"{bot_username}/{name}", seconds=seconds)
+
+    database, llm = components["database"], components["llm"]
+    vision, rag, summarizer = components["vision"], components["rag"], components.get("summarizer")
 
     telegram_bot = TelegramBot(
         id=bot_id,
@@ -186,13 +585,28 @@ async def telegram_post_init(config_json, identity: str, path: Path, self: Appli
         database=database,
         llm=llm, 
         vision=vision,
-        rag=rag
+        rag=rag,
+        summarizer=summarizer,
+        llm_pricing=llm_pricing
     )
-    await telegram_bot.start()
+    with startup_profile.measure(phase="init", component=f"{bot_username}/start"):
+        await telegram_bot.start()
+    self.post_stop = lambda _: telegram_bot.stop()
     logger.info(f"Bot started: {bot_id}")
 
 if __name__ == "__main__":
-    arg_parser = argparse.ArgumentParser(description="Run Telegram bot whose configuration lives in specified folder.")
-    arg_parser.add_argument("folder_name", type=str, help="Folder name of the Telegram bot")
+    arg_parser = argparse.ArgumentParser(description="Run Telegram bots whose configuration lives in specified folders.")
+    arg_parser.add_argument("folder_names", type=str, nargs="+", help="Folder names of the Telegram bots")
+    arg_parser.add_argument(
+        "--workers", 
+        type=int, 
+        default=0, 
+        help="Number of worker processes handling updates sharded by chat, 0 handles them in-process"
+    )
+    arg_parser.add_argument(
+        "--profile-startup", 
+        action="store_true", 
+        help="Log the import and initialization time of each component once all bots are running"
+    )
     args = arg_parser.parse_args()
-    start(folder_name=args.folder_name)
+    start(folder_names=args.folder_names, workers=args.workers, profile_startup=args.profile_startup)
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import timedelta
+from telegram import Message as TelegramMessage
+from telegram.error import BadRequest, RetryAfter
+import time
+from typing import List
+from weakref import WeakValueDictionary
+
+from database import Database, Message
+from helpers import split_markdown, to_markdown_v2
+from logger import logger
+
+class ReplySender:
+    """Sends LLM replies to Telegram, split into as many messages as they need.
+
+    Replies are split at Markdown-safe boundaries to fit Telegram's message length limit
+    and sent in order, waiting out flood control (`RetryAfter`) instead of failing. Replies
+    to the same chat never interleave. All sent chunks are persisted in one transaction.
+    Send latency is observed by the caller as the `send` stage of the metrics.
+    """
+
+    def __init__(self, database: Database, max_retries: int = 5):
+        self.database = database
+        self.max_retries = max_retries
+
+        # Locks are dropped as soon as no reply to their chat is in flight
+        self._locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
+
+    async def reply(self, message: TelegramMessage, text: str) -> List[TelegramMessage]:
+        chunks = split_markdown(text)
+
+        lock = self._locks.get(message.chat_id)
+        if lock is None:
+            lock = self._locks[message.chat_id] = asyncio.Lock()
+
+        sent_messages: List[TelegramMessage] = []
+        started_at = time.perf_counter()
+        async with lock:
+            try:
+                for index, chunk in enumerate(chunks):
+                    sent_messages.append(await self._send(message=message, chunk=chunk, quote=index == 0))
+            finally:
+                # Chunks sent before a failure are persisted too
+                await asyncio.to_thread(self._persist, message=message, chunks=chunks, sent_messages=sent_messages)
+
+        logger.info(
+            'msg_out - chat_id: %s - msg_id: %s - chunks: %d - latency: %.0fms', 
+            message.chat_id, message.id, len(sent_messages), (time.perf_counter() - started_at) * 1000
+        )
+        return sent_messages
+
+    async def _send(self, message: TelegramMessage, chunk: str, quote: bool) -> TelegramMessage:
+        text, parse_mode = to_markdown_v2(chunk), 'MarkdownV2'
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await message.reply_text(text, parse_mode=parse_mode, do_quote=quote)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                logger.warning('msg_out_retry - chat_id: %s - msg_id: %s - retry_after: %ss', message.chat_id, message.id, seconds)
+                await asyncio.sleep(seconds)
+            except BadRequest as e:
+                if parse_mode is None or "can't parse entities" not in e.message.lower():
+                    raise
+
+                # Rather plain text than no reply at all
+                logger.warning('msg_out_plain - chat_id: %s - msg_id: %s - error: %s', message.chat_id, message.id, e)
+                text, parse_mode = chunk, None
+
+        raise RuntimeError('Exceeded send retries')
+
+    def _persist(self, message: TelegramMessage, chunks: List[str], sent_messages: List[TelegramMessage]):
+        if not sent_messages:
+            return
+
+        with self.database.Session.begin() as session:
+            for chunk, sent_message in zip(chunks, sent_messages):
+                if sent_message.from_user is None:
+                    continue
+
+                session.add(Message(
+                    id=sent_message.id,
+                    user_id=sent_message.from_user.id,
+                    chat_id=message.chat_id,
+                    text=chunk,
+                    created_at=sent_message.date,
+                    reply_to_id=message.id
+                ))
+
+        logger.info('msg_out_persisted - chat_id: %s - msg_id: %s - chunks: %d', message.chat_id, message.id, len(sent_messages))
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple
+
+from logger import logger
+
+class StageGraph:
+    """Small dependency graph of async stages.
+
+    Every stage starts as soon as the stages it depends on have completed, so independent
+    stages run concurrently. A stage is called with the results of its dependencies as
+    keyword arguments named after them, and the time spent in each stage is logged once
+    the graph completes.
+
+    Example:
+        stages = StageGraph(label="chat_id: 1")
+        stages.add("embedding", embed)
+        stages.add("recent_messages", load_recent)
+        stages.add("rag_messages", search, depends_on=["embedding"])
+        results = await stages.run()
+    """
+
+    def __init__(self, label: str):
+        self._label = label
+        self._stages: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], depends_on: Sequence[str] = ()):
+        if name in self._stages:
+            raise ValueError(f"stage already added: {name}")
+
+        # Dependencies must be added first, which also rules out cycles
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"stage {name} depends on unknown stage: {dependency}")
+
+        self._stages[name] = (func, tuple(depends_on))
+
+    async def run(self) -> Dict[str, Any]:
+        started_at = time.perf_counter()
+
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(self._run_stage(name=name, tasks=tasks))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        finally:
+            # Stop the remaining stages if one of them failed
+            for task in tasks.values():
+                task.cancel()
+
+        self.timings["total"] = time.perf_counter() - started_at
+        logger.info(
+            f"stage_timings - {self._label} - "
+            + " - ".join(f"{name}: {seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+        )
+
+        return dict(zip(tasks.keys(), results))
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]) -> Any:
+        func, depends_on = self._stages[name]
+        dependencies = {dependency: await tasks[dependency] for dependency in depends_on}
+
+        started_at = time.perf_counter()
+        result = await func(**dependencies)
+        self.timings[name] = time.perf_counter() - started_at
+        return result
@@ -0,0 +1,54 @@
+import importlib
+from contextlib import contextmanager
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+from logger import logger
+
+class StartupProfile:
+    """Import and initialization time of each startup component.
+
+    Timings are always collected, they are cheap, and only logged by `report`, which
+    `run.py --profile-startup` calls once all bots are running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings: List[Tuple[str, str, float]] = []
+        self._started_at = time.perf_counter()
+
+    def record(self, phase: str, component: str, seconds: float):
+        with self._lock:
+            self._timings.append((phase, component, seconds))
+
+    @contextmanager
+    def measure(self, phase: str, component: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase=phase, component=component, seconds=time.perf_counter() - started_at)
+
+    def report(self):
+        with self._lock:
+            timings = sorted(self._timings, key=lambda timing: timing[2], reverse=True)
+
+        for phase, component, seconds in timings:
+            logger.info('startup_profile - %s: %s - %.0fms', phase, component, seconds * 1000)
+        logger.info('startup_profile - total: %.0fms', (time.perf_counter() - self._started_at) * 1000)
+
+startup_profile = StartupProfile()
+
+def import_modules(modules: Iterable[str]):
+    """Import modules in order, recording the time each one takes.
+
+    Dependencies shared between modules count towards the first module importing them.
+    """
+    for module in modules:
+        if module in sys.modules:
+            continue
+
+        with startup_profile.measure(phase="import", component=module):
+            importlib.import_module(module)
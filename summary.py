@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from database import Database, Summary
+from llm.client import LLMClient
+from logger import logger
+from metrics import Pricing, record_llm_usage
+from prompt import generate_summary_prompt
+
+class Summarizer:
+    """Condenses older messages of each chat into stored summaries in the background.
+
+    The newest `recent_messages` messages of a chat are always left as they are. Once at
+    least `segment_size` older messages haven't been summarized yet, they are condensed
+    into a new summary that also carries over the previous one. Replies are then built
+    from the latest summary plus the messages after it, which keeps the context sent to
+    the LLM bounded however active a chat is.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        llm: LLMClient,
+        bot_name: str,
+        context_window: timedelta,
+        recent_messages: int = 50,
+        segment_size: int = 100,
+        llm_pricing: Pricing | None = None
+    ):
+        self.database = database
+        self.llm = llm
+        self.bot_name = bot_name
+        self.context_window = context_window
+        self.recent_messages = recent_messages
+        self.segment_size = segment_size
+        self.llm_pricing = llm_pricing
+
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def schedule(self, chat_id: int):
+        # A chat is summarized by at most one task at a time
+        task = self._tasks.get(chat_id)
+        if task is not None and not task.done():
+            return
+
+        self._tasks[chat_id] = asyncio.create_task(self._run(chat_id=chat_id))
+
+    async def _run(self, chat_id: int):
+        try:
+            while await asyncio.to_thread(self._summarize_next_segment, chat_id=chat_id):
+                pass
+        except Exception as e:
+            logger.error(f'summary_failed - chat_id: {chat_id} - error: {e}')
+        finally:
+            del self._tasks[chat_id]
+
+    def _summarize_next_segment(self, chat_id: int) -> bool:
+        latest_summary = self.database.get_latest_summary(chat_id=chat_id)
+        messages = self.database.get_messages_since(
+            chat_id=chat_id,
+            since=self.context_window,
+            after_id=latest_summary.end_message_id if latest_summary else None
+        )
+        if len(messages) < self.recent_messages + self.segment_size:
+            return False
+
+        segment = messages[:self.segment_size]
+
+        # A summary that fell out of the context window isn't carried over
+        previous_summary = self.database.get_latest_summary(chat_id=chat_id, since=self.context_window)
+        summary = self.llm.summarize(
+            prompt=generate_summary_prompt(
+                bot_name=self.bot_name,
+                previous_summary=previous_summary.text if previous_summary else None
+            ),
+            messages=segment
+        )
+        if summary.usage:
+            record_llm_usage(
+                chat_id=chat_id, 
+                input_tokens=summary.usage.input_tokens, 
+                output_tokens=summary.usage.output_tokens, 
+                pricing=self.llm_pricing
+            )
+
+        with self.database.Session.begin() as session:
+            session.add(Summary(
+                chat_id=chat_id,
+                text=summary.text,
+                start_message_id=segment[0].id,
+                end_message_id=segment[-1].id,
+                end_at=segment[-1].created_at,
+                created_at=datetime.now(timezone.utc)
+            ))
+
+        logger.info(
+            f'summary_persisted - chat_id: {chat_id} - '
+            f'start_msg_id: {segment[0].id} - end_msg_id: {segment[-1].id}'
+        )
+        return True
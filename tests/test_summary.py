@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from telegram.ext import ApplicationBuilder
+
+from bot import TelegramBot
+from database import Database, Message
+from llm.client import Response, SummaryResponse
+from summary import Summarizer
+
+BOT_ID = 1000
+CHAT_ID = -1
+CONTEXT_WINDOW = timedelta(hours=12)
+
+class RecordingLLMClient:
+    def __init__(self):
+        self.summary_prompts: List[str] = []
+        self.response_prompts: List[str] = []
+
+    def generate_response(self, prompt: str, messages: List[Message]) -> Response:
+        self.response_prompts.append(prompt)
+        return Response(message="Hi", reaction_strength=0)
+
+    def summarize(self, prompt: str, messages: List[Message]) -> SummaryResponse:
+        self.summary_prompts.append(prompt)
+        return SummaryResponse(text=f"Summary #{len(self.summary_prompts)} of the chat.")
+
+def test_prompt_only_contains_the_latest_summary(tmp_path):
+    database = Database(path=tmp_path, admin_user_id=1, bot_id=BOT_ID, bot_name="Bot", bot_username="bot")
+    now = datetime.now(timezone.utc)
+    with database.Session.begin() as session:
+        for index in range(350):
+            session.add(Message(
+                id=index + 1,
+                chat_id=CHAT_ID,
+                user_id=100,
+                text=f"Message {index}",
+                created_at=now - timedelta(minutes=350 - index)
+            ))
+
+    llm = RecordingLLMClient()
+    summarizer = Summarizer(
+        database=database,
+        llm=llm,
+        bot_name="Bot",
+        context_window=CONTEXT_WINDOW,
+        recent_messages=50,
+        segment_size=100
+    )
+    while summarizer._summarize_next_segment(chat_id=CHAT_ID):
+        pass
+
+    # Each summary is given the previous one to carry over
+    assert len(llm.summary_prompts) == 3
+    assert "Summary #1" in llm.summary_prompts[1]
+    assert "Summary #2" in llm.summary_prompts[2]
+
+    bot = TelegramBot(
+        id=BOT_ID,
+        name="Bot",
+        username="bot",
+        admin_user_id=1,
+        context_window=CONTEXT_WINDOW,
+        reaction_threshold=1,
+        identity="You are a test.",
+        path=tmp_path,
+        telegram=ApplicationBuilder().token("1:test").build(),
+        database=database,
+        llm=llm,
+        vision=None,
+        rag=None,
+        summarizer=summarizer
+    )
+
+    async def reply():
+        summary = await bot._get_summary(chat_id=CHAT_ID)
+        recent_messages = await bot._get_recent_messages(chat_id=CHAT_ID, summary=summary)
+        await bot._generate_response(
+            chat_id=CHAT_ID,
+            summary=summary,
+            rag_messages=[],
+            recent_messages=recent_messages,
+            members=[]
+        )
+        return recent_messages
+
+    recent_messages = asyncio.run(reply())
+
+    prompt = llm.response_prompts[-1]
+    assert prompt.count("Summary #") == 1
+    assert "Summary #3" in prompt
+    assert len(recent_messages) == 50
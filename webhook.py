@@ -0,0 +1,81 @@
+from aiohttp import web
+from functools import partial
+import hmac
+from typing import Any, Awaitable, Callable, Dict, List
+
+from logger import logger
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+UpdateCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+class WebhookServer:
+    """Local HTTP server receiving Telegram webhook updates.
+
+    Every bot is registered under its own URL path, so several bots can share a single
+    server (and a single port behind a load balancer). A bot's path is only served on its
+    own address. Updates are handed to the bot's callback as the raw JSON dict posted by
+    Telegram, which also makes the server easy to exercise locally by POSTing recorded
+    update JSON.
+
+    Requests that can never succeed (malformed JSON, not an update, an update the bot
+    fails to parse) are answered with 400, as Telegram retries 5xx responses.
+    """
+
+    def __init__(self):
+        self._apps: Dict[tuple[str, int], web.Application] = {}
+        self._runners: List[web.AppRunner] = []
+
+    @property
+    def has_routes(self) -> bool:
+        return len(self._apps) > 0
+
+    def add_route(
+        self,
+        path: str,
+        listen: str,
+        port: int,
+        on_update: UpdateCallback,
+        secret_token: str | None = None
+    ):
+        app = self._apps.setdefault((listen, port), web.Application())
+        app.router.add_post(f"/{path.strip('/')}", partial(self._on_request, on_update, secret_token))
+
+    async def start(self):
+        for (listen, port), app in self._apps.items():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            self._runners.append(runner)
+            await web.TCPSite(runner, host=listen, port=port).start()
+            logger.info(f"Webhook server listening: {listen}:{port}")
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+    async def _on_request(self, on_update: UpdateCallback, secret_token: str | None, request: web.Request) -> web.Response:
+        # Constant time comparison, of bytes as compare_digest rejects non-ASCII strings
+        received_token = request.headers.get(SECRET_TOKEN_HEADER, "").encode("utf-8", "surrogatepass")
+        if secret_token and not hmac.compare_digest(received_token, secret_token.encode("utf-8")):
+            logger.warning(f"webhook_rejected - path: {request.path} - reason: secret token mismatch")
+            return web.Response(status=403)
+
+        try:
+            update_json = await request.json()
+        except ValueError:
+            # Also raised for bodies that aren't UTF-8
+            logger.warning(f"webhook_rejected - path: {request.path} - reason: malformed json")
+            return web.Response(status=400)
+
+        if not isinstance(update_json, dict) or not isinstance(update_json.get("update_id"), int):
+            logger.warning(f"webhook_rejected - path: {request.path} - reason: not an update")
+            return web.Response(status=400)
+
+        try:
+            await on_update(update_json)
+        except Exception as e:
+            logger.error(f"webhook_rejected - path: {request.path} - update_id: {update_json['update_id']} - error: {e}")
+            return web.Response(status=400)
+
+        return web.Response()
@@ -0,0 +1,148 @@
+import asyncio
+from contextlib import contextmanager
+import fcntl
+import multiprocessing
+from pathlib import Path
+import queue
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+# Update payloads addressed to a user rather than a chat (e.g. inline queries)
+USER_KEYS = ("from", "user")
+
+# Items a worker queue holds before dispatching to it waits, so a stalled shard applies backpressure
+QUEUE_SIZE = 1000
+
+# Seconds between attempts to dispatch to a full queue
+DISPATCH_RETRY_INTERVAL = 0.05
+
+# Held while a worker creates or migrates a bot's storage, in the bot's resources folder
+STORAGE_LOCK_FILE = "storage.lock"
+
+def shard_key(update_json: Dict[str, Any]) -> int:
+    """Determine the key an update is sharded by, without parsing the full update.
+
+    Updates are keyed by their chat id, falling back to the sending user's id for
+    updates that don't belong to a chat.
+
+    Args:
+        update_json: The raw update as posted by Telegram.
+
+    Returns:
+        int: The chat id, user id or 0 when the update carries neither.
+    """
+    for key, payload in update_json.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+
+        # Callback queries carry the chat on the message the button belongs to
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+
+        for user_key in USER_KEYS:
+            user = payload.get(user_key)
+            if user:
+                return user["id"]
+
+    return 0
+
+class ShardedWorkerPool:
+    """Pool of worker processes receiving items sharded by key.
+
+    All items sharing a key land on the same worker queue, so their relative order is
+    preserved while different keys are processed on separate cores.
+
+    Each worker runs `target(worker_index, queue, *args)` and must return once it reads
+    the `None` sentinel from its queue. Workers are expected to run until stopped, so
+    the owner of the pool should stop when `wait_for_exit` returns.
+    """
+
+    def __init__(
+        self, 
+        num_workers: int, 
+        target: Callable[..., None], 
+        args: Tuple[Any, ...] = (), 
+        queue_size: int = QUEUE_SIZE
+    ):
+        context = multiprocessing.get_context("spawn")
+        self._queues = [context.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._processes = [
+            context.Process(target=target, args=(index, queue, *args), name=f"worker-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+
+    async def dispatch(self, key: int, item: Any):
+        """Put `item` on the queue of the worker owning `key`, waiting while the queue is full.
+
+        Raises:
+            RuntimeError: The worker exited, its queue would never be drained.
+        """
+        index = key % len(self._queues)
+        while True:
+            try:
+                self._queues[index].put_nowait(item)
+                return
+            except queue.Full:
+                if not self._processes[index].is_alive():
+                    raise RuntimeError(f"worker {index} exited")
+                await asyncio.sleep(DISPATCH_RETRY_INTERVAL)
+
+    async def wait_for_exit(self) -> Tuple[int, int | None]:
+        """Wait until any worker process exits.
+
+        Returns:
+            Tuple[int, int | None]: The index and exit code of the worker that exited.
+        """
+        loop = asyncio.get_running_loop()
+        exited: asyncio.Future[int] = loop.create_future()
+
+        def on_exit(index: int):
+            if not exited.done():
+                exited.set_result(index)
+
+        # A process sentinel becomes readable once the process ends
+        for index, process in enumerate(self._processes):
+            loop.add_reader(process.sentinel, on_exit, index)
+        try:
+            index = await exited
+
+            # The sentinel is closed slightly before the process can be reaped
+            self._processes[index].join(timeout=1)
+            return index, self._processes[index].exitcode
+        finally:
+            for process in self._processes:
+                loop.remove_reader(process.sentinel)
+
+    def stop(self, timeout: float = 30):
+        for worker_queue, process in zip(self._queues, self._processes):
+            if not process.is_alive():
+                continue
+            try:
+                worker_queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+
+        for worker_queue, process in zip(self._queues, self._processes):
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+            # Items left for an exited worker are dropped instead of blocking this process' exit
+            worker_queue.cancel_join_thread()
+
+@contextmanager
+def interprocess_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on the file at `path`, shared by all processes using that path.
+
+    Used around work each worker process would otherwise race on, like creating a bot's storage.
+    """
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)